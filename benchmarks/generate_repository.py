@@ -0,0 +1,126 @@
+""" Generates synthetic git repositories to benchmark viseagull.
+
+The generated history is deterministic for a given set of parameters : the same seed
+always gives the same files, contents, commits, dates and hashes.
+"""
+
+import subprocess
+
+from argparse import ArgumentParser
+from os import path, makedirs, environ
+from random import Random
+
+WORDS = ['data', 'file', 'commit', 'cluster', 'route', 'city', 'building', 'node', 'graph', 'parse',
+    'load', 'save', 'compute', 'update', 'matrix', 'distance', 'index', 'layout', 'color', 'height',
+    'user', 'request', 'response', 'cache', 'token', 'stream', 'buffer', 'config', 'logger', 'error']
+
+
+def git(repo_folder, *args, env=None):
+
+    subprocess.run(['git', *args], cwd=repo_folder, check=True, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def python_source(rng, number_functions=3):
+    """ Returns the content of a Python file made of functions with random identifiers.
+    """
+
+    lines = []
+    for _ in range(number_functions):
+        function_name = '_'.join(rng.sample(WORDS, 2))
+        variables = ['_'.join(rng.sample(WORDS, 2)) for _ in range(3)]
+        lines.append(f'def {function_name}({variables[0]}):')
+        lines.append(f'    {variables[1]} = {variables[0]}')
+        lines.append(f'    {variables[2]} = {variables[1]}')
+        lines.append(f'    return {variables[2]}')
+        lines.append('')
+
+    return '\n'.join(lines)
+
+def files_per_commit(rng, mean_files_per_commit, max_files_per_commit):
+    """ Draws the number of files modified by a commit from a geometric distribution.
+    """
+
+    p = 1 / mean_files_per_commit
+    number_files = 1
+    while rng.random() > p and number_files < max_files_per_commit:
+        number_files += 1
+
+    return number_files
+
+def generate_repository(repo_folder, number_commits=100, number_files=50, mean_files_per_commit=3,
+        max_files_per_commit=20, rename_rate=0.01, number_modules=5, seed=0):
+    """ Creates a git repository in repo_folder with a synthetic history.
+
+    Files are spread in number_modules folders, and commits mostly modify files of the same
+    module so the history has couplings to detect.
+    """
+
+    rng = Random(seed)
+    makedirs(repo_folder, exist_ok=True)
+    git(repo_folder, 'init', '-q')
+
+    env = dict(environ)
+    env.update({
+        'GIT_AUTHOR_NAME': 'viseagull', 'GIT_AUTHOR_EMAIL': 'viseagull@example.com',
+        'GIT_COMMITTER_NAME': 'viseagull', 'GIT_COMMITTER_EMAIL': 'viseagull@example.com'
+        })
+
+    files = []
+    for commit_number in range(number_commits):
+
+        # Create the files progressively during the first half of the history
+        number_new_files = 0
+        if len(files) < number_files:
+            number_new_files = max(1, (number_files * 2) // max(1, number_commits))
+            number_new_files = min(number_new_files, number_files - len(files))
+
+        modified_files = set()
+        for _ in range(number_new_files):
+            file_name = path.join(f'module_{len(files) % number_modules}', f'file_{len(files)}.py')
+            files.append(file_name)
+            modified_files.add(file_name)
+
+        module = rng.randrange(number_modules)
+        module_files = [file_name for file_name in files if file_name.startswith(f'module_{module}')] or files
+        for _ in range(files_per_commit(rng, mean_files_per_commit, max_files_per_commit)):
+            # Mostly files of the same module, sometimes a file of another module
+            candidates = module_files if rng.random() < 0.8 else files
+            modified_files.add(rng.choice(candidates))
+
+        for file_name in sorted(modified_files):
+            file_path = path.join(repo_folder, file_name)
+            makedirs(path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(python_source(rng))
+            git(repo_folder, 'add', file_name)
+
+        if rng.random() < rename_rate and len(files) > 1:
+            index = rng.randrange(len(files))
+            old_name = files[index]
+            if old_name not in modified_files:
+                new_name = old_name[:-3] + f'_r{commit_number}.py'
+                git(repo_folder, 'mv', old_name, new_name)
+                files[index] = new_name
+
+        date = f'{1600000000 + commit_number * 3600} +0000'
+        env['GIT_AUTHOR_DATE'] = date
+        env['GIT_COMMITTER_DATE'] = date
+        git(repo_folder, 'commit', '-q', '-m', f'Commit {commit_number}', env=env)
+
+    return repo_folder
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description='Generates a synthetic git repository')
+    parser.add_argument('folder', type=str)
+    parser.add_argument('--commits', type=int, default=100)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--mean-files-per-commit', type=float, default=3)
+    parser.add_argument('--max-files-per-commit', type=int, default=20)
+    parser.add_argument('--rename-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_repository(args.folder, args.commits, args.files, args.mean_files_per_commit,
+            args.max_files_per_commit, args.rename_rate, seed=args.seed)
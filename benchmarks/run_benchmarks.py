@@ -0,0 +1,229 @@
+""" Benchmarks the steps of viseagull on synthetic repositories of increasing size.
+
+Usage :
+    python benchmarks/run_benchmarks.py --grid 100x50,500x200 --output results.json
+    python benchmarks/run_benchmarks.py --grid 100x50,500x200 --compare results.json
+
+Each size of the grid is given as COMMITSxFILES. The results contain the time and peak memory
+of each step for each size, and can be compared with the results of another revision.
+The steps are timed with tracemalloc off, the peak memory is measured by a second run of each size
+(skipped with --no-memory) as tracing the allocations slows down the Python code several times.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import tracemalloc
+
+from argparse import ArgumentParser
+from os import path, makedirs, chdir, getcwd
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from generate_repository import generate_repository
+
+from viseagull.profiler import Profiler, set_profiler, get_profiler
+
+STEPS = ['Analyzer init', 'compute_couplings', 'get_distance_matrix', 'compute_clustering', 'setup_visualization_data']
+
+
+def revision():
+    """ Returns the git revision of viseagull the benchmarks are run on.
+    """
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=path.dirname(path.abspath(__file__))).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+def measure(results, name, function):
+    """ Runs function, records in results under name its peak memory if the profiler is enabled,
+    its time otherwise, and returns its result.
+    """
+
+    profiler = get_profiler()
+    start_time = perf_counter()
+    with profiler.span(name):
+        result = function()
+    seconds = perf_counter() - start_time
+
+    if profiler.enabled:
+        # The span of the step is the last one to finish
+        results[name] = {'peak_memory': profiler.spans[-1]['peak_memory']}
+    else:
+        results[name] = {'seconds': seconds}
+
+    return result
+
+def benchmark_size(repo_folder, couplings_type):
+
+    from viseagull.analysis.LogicalAnalyzer import LogicalAnalyzer
+    from viseagull.analysis.SemanticAnalyzer import SemanticAnalyzer
+    from viseagull.clustering.LogicalClusterer import LogicalClusterer
+    from viseagull.clustering.SemanticClusterer import SemanticClusterer
+    from viseagull.data_processing.DataProcessor import DataProcessor
+
+    analyzer_class = LogicalAnalyzer if couplings_type == 'logical' else SemanticAnalyzer
+    clusterer_class = LogicalClusterer if couplings_type == 'logical' else SemanticClusterer
+
+    results = {}
+    analyzer = measure(results, 'Analyzer init', lambda: analyzer_class(repo_folder))
+    measure(results, 'compute_couplings', analyzer.compute_couplings)
+    distance_matrix = measure(results, 'get_distance_matrix', analyzer.get_distance_matrix)
+    clusterer = clusterer_class(distance_matrix)
+    measure(results, 'compute_clustering', clusterer.compute_clustering)
+    data_processor = DataProcessor(analyzer, clusterer)
+    measure(results, 'setup_visualization_data', data_processor.setup_visualization_data)
+
+    return results
+
+def benchmark_in_work_folder(repo_folder, couplings_type):
+    """ Runs benchmark_size from an empty work folder, removed afterwards.
+    """
+
+    cwd = getcwd()
+    # The visualization data is written relatively to the working directory
+    with TemporaryDirectory() as work_folder:
+        makedirs(path.join(work_folder, 'visualization'))
+        makedirs(path.join(work_folder, 'saved_templates'))
+        chdir(work_folder)
+        try:
+            return benchmark_size(repo_folder, couplings_type)
+        finally:
+            chdir(cwd)
+
+def run(grid, couplings_type, seed, repos_folder, measure_memory=True):
+
+    report = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'couplings_type': couplings_type,
+        'seed': seed,
+        'results': {},
+        'profiles': {}
+        }
+
+    for number_commits, number_files in grid:
+
+        size = f'{number_commits}x{number_files}'
+        repo_folder = path.abspath(path.join(repos_folder, f'repo_{size}_{seed}'))
+        if not path.exists(repo_folder):
+            print(f'Generating {size} repository', file=sys.stderr)
+            generate_repository(repo_folder, number_commits, number_files, seed=seed)
+
+        set_profiler(Profiler(enabled=False))
+        results = benchmark_in_work_folder(repo_folder, couplings_type)
+
+        if measure_memory:
+            set_profiler(Profiler())
+            try:
+                memory_results = benchmark_in_work_folder(repo_folder, couplings_type)
+            finally:
+                tracemalloc.stop()
+            for step, result in memory_results.items():
+                results[step].update(result)
+            report['profiles'][size] = get_profiler().report()
+        else:
+            for result in results.values():
+                result['peak_memory'] = None
+
+        report['results'][size] = results
+        print(f'{size} : ' + ', '.join(f"{step} {result['seconds']:.2f}s"
+                for step, result in results.items()), file=sys.stderr)
+
+    set_profiler(Profiler(enabled=False))
+
+    return report
+
+def comparison_error(couplings_type, seed, reference):
+    """ Returns why a run cannot be compared with the reference results, None if it can.
+    References written before the seed was recorded are assumed to use the default seed.
+    """
+
+    if reference['couplings_type'] != couplings_type:
+        return f"the reference was run with {reference['couplings_type']} couplings, not {couplings_type}"
+
+    if reference.get('seed', 0) != seed:
+        return f"the reference was run on the repositories of seed {reference.get('seed', 0)}, not {seed}"
+
+    return None
+
+def compare(report, reference, threshold, min_seconds=0.1):
+    """ Prints the ratio between the times of report and reference, returns the list of regressions.
+    The time ratio of a step shorter than min_seconds in both runs is only noise and is ignored,
+    the memory ratio is ignored if one of the runs did not measure the memory.
+    """
+
+    regressions = []
+    for size, results in report['results'].items():
+        if size not in reference['results']:
+            continue
+        for step, result in results.items():
+            reference_result = reference['results'][size].get(step)
+            if reference_result is None or reference_result['seconds'] == 0:
+                continue
+            ratio = result['seconds'] / reference_result['seconds']
+            memory_ratio = None
+            if result['peak_memory'] is not None and reference_result['peak_memory'] is not None:
+                memory_ratio = result['peak_memory'] / max(1, reference_result['peak_memory'])
+            too_short = max(result['seconds'], reference_result['seconds']) < min_seconds
+            print(f'{size} {step} : time x{ratio:.2f}{" (too short, ignored)" if too_short else ""}, '
+                    + ('memory not measured' if memory_ratio is None else f'memory x{memory_ratio:.2f}'))
+            if too_short:
+                ratio = 1
+            if memory_ratio is None:
+                memory_ratio = 1
+            if ratio > threshold or memory_ratio > threshold:
+                regressions.append((size, step, ratio, memory_ratio))
+
+    return regressions
+
+def parse_grid(grid):
+
+    return [tuple(int(value) for value in size.split('x')) for size in grid.split(',')]
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description='Benchmarks viseagull on synthetic repositories')
+    parser.add_argument('--grid', type=str, default='100x50,300x150,1000x300',
+            help='comma separated sizes, each given as COMMITSxFILES')
+    parser.add_argument('--couplings', type=str, default='logical', choices=['logical', 'semantic'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repos-folder', type=str, default='./benchmark_repos',
+            help='folder where the generated repositories are kept between runs')
+    parser.add_argument('--output', type=str, help='file where the results are written')
+    parser.add_argument('--compare', type=str, help='results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5,
+            help='time or memory ratio above which a step is reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.1,
+            help='steps shorter than this in both runs are not reported as time regressions')
+    parser.add_argument('--no-memory', action='store_true',
+            help='skips the second run of each size measuring the peak memory of the steps')
+    args = parser.parse_args()
+
+    # The reference is checked before running the benchmark
+    reference = None
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as f:
+            reference = json.load(f)
+        error = comparison_error(args.couplings, args.seed, reference)
+        if error is not None:
+            parser.error(f'Cannot compare with {args.compare} : {error}.')
+
+    report = run(parse_grid(args.grid), args.couplings, args.seed, args.repos_folder, not args.no_memory)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+
+    if reference is not None:
+        regressions = compare(report, reference, args.threshold, args.min_seconds)
+        if len(regressions) > 0:
+            print(f'{len(regressions)} regressions above x{args.threshold}')
+            sys.exit(1)
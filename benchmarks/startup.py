@@ -0,0 +1,78 @@
+""" Measures the startup time of viseagull and checks which modules each mode imports.
+
+Usage :
+    python benchmarks/startup.py [--max-seconds 0.5]
+
+Fails if --load imports part of the scientific stack, if the logical mode imports nltk,
+or if the import of the command line module takes more than --max-seconds.
+"""
+
+import json
+import subprocess
+import sys
+
+from argparse import ArgumentParser
+from os import path
+
+ROOT_FOLDER = path.dirname(path.dirname(path.abspath(__file__)))
+
+SCIENTIFIC_MODULES = ['numpy', 'pandas', 'scipy', 'sklearn', 'prince', 'nltk', 'pydriller', 'git']
+
+# Each mode imports the modules it needs, then prints its import time and the loaded modules
+MODES = {
+    'load': """
+import viseagull.viseagull
+from viseagull.data_processing.TemplateStore import TemplateStore
+""",
+    'logical': """
+import viseagull.viseagull
+from viseagull.pipeline.Pipeline import Pipeline
+from viseagull.analysis.LogicalAnalyzer import LogicalAnalyzer
+from viseagull.clustering.LogicalClusterer import LogicalClusterer
+""",
+}
+
+FORBIDDEN_MODULES = {
+    'load': SCIENTIFIC_MODULES,
+    'logical': ['nltk', 'prince'],
+}
+
+
+def measure_mode(mode):
+    """ Imports the modules of a mode in a fresh interpreter, returns the import time and the loaded top level modules.
+    """
+
+    code = ("import sys, time, json\n"
+        "start_time = time.perf_counter()\n"
+        + MODES[mode] +
+        "print(json.dumps({'seconds': time.perf_counter() - start_time, "
+        "'modules': sorted(set(name.split('.')[0] for name in sys.modules))}))\n")
+
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_FOLDER, capture_output=True, text=True, check=True)
+
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description='Measures the startup time of viseagull')
+    parser.add_argument('--max-seconds', type=float, default=0.5,
+            help='maximum import time of the --load mode')
+    args = parser.parse_args()
+
+    failed = False
+    for mode in MODES.keys():
+
+        result = measure_mode(mode)
+        forbidden = [module for module in FORBIDDEN_MODULES[mode] if module in result['modules']]
+        print(f"{mode} : imported in {result['seconds']:.3f}s")
+
+        if len(forbidden) > 0:
+            print(f"{mode} : imports {', '.join(forbidden)}")
+            failed = True
+
+    if measure_mode('load')['seconds'] > args.max_seconds:
+        print(f'load : import takes more than {args.max_seconds}s')
+        failed = True
+
+    sys.exit(1 if failed else 0)
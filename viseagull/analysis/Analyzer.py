@@ -1,23 +1,41 @@
 from os import path
 from atexit import register
+from collections import namedtuple
+from hashlib import sha1
 from tempfile import TemporaryDirectory
 from shutil import rmtree
 from distutils.dir_util import copy_tree
 from time import time
+from datetime import datetime
 
-from git import Repo
-from pandas import DataFrame
+from git import Repo, GitCommandError
+from pandas import DataFrame, Series, concat
 
 from pydriller import Repository, Git
 from tqdm import tqdm
 
+from viseagull.profiler import get_profiler, profiled
 
+from .CommitFilter import CommitFilter
+
+
+# Light-weight copy of the data of a pydriller Commit used by the analysis
+CommitRecord = namedtuple('CommitRecord', ['hash', 'committer_date', 'modified_paths', 'number_modified_files'])
 
 
 class Analyzer:
 
-    def __init__(self, url, remove_bulk=-1):
+    def __init__(self, url, remove_bulk=-1, mine_history=True, clone_cache=None,
+            since=None, until=None, last_n_commits=None, commit_filter=None, directory_depth=None):
         """ Downloads the repo in a temp folder if it is not stored locally.
+        If clone_cache is given, remote repos are cloned once in this folder and only
+        pulled by the next runs.
+        since, until (datetimes) and last_n_commits restrict the analyzed commits, they are
+        given to the repository mining so the other commits are never diffed.
+        commit_filter is a CommitFilter applied during the mining, by default it only removes
+        the commits with more than remove_bulk files.
+        If directory_depth is given, the couplings are computed between the directories at this
+        depth instead of the files, which bounds the size of the analysis for big repos.
         Create a repository mining object to later analyze the commits.
         Registers a function to supress the temp folder at the end of the execution
         if the repo was stored remotely.
@@ -28,8 +46,10 @@ class Analyzer:
             repository_mining : Repository object to analyze the repo
             git_repo : Git object
             repo_files_path : list of paths to the files contained in the repo
+            repo_files_set : set of the paths of repo_files_path, for fast lookups
+            directory_depth : depth of the directories the files are aggregated to, None to analyze files
             repo_files : list of files contained in the repo
-            total_commits : total number of commits
+            total_commits : total number of commits (in the analyzed window)
             commit_graph : networkx graph object of files in the repo
             filename_to_path : dict to get path of file in repo given its name
             path_prefix : path prefix specific to the computer you are using
@@ -38,22 +58,32 @@ class Analyzer:
 
         self.url = url
         self.is_remote = False
+        self._tmp_dir = None
         
         self.remove_bulk = remove_bulk
+        self.commit_filter = commit_filter if commit_filter is not None else CommitFilter(max_files=remove_bulk)
+        self.directory_depth = directory_depth
 
         # Clone repo if necessary
-        if self._is_remote_repository(url):
+        if self._is_remote_repository(url) and clone_cache is not None:
+            self.repo_folder = self._update_cached_clone(clone_cache, url)
+            self.is_remote = True
+        elif self._is_remote_repository(url):
             self.repo_folder = self._clone_remote_repository(self._clone_folder(), url)
             self.is_remote = True
         else:
             self.repo_folder = self._clone_local_repository(self._clone_folder(), url)
 
-        # Get a Repository object
-        self.repository_mining = Repository(self.repo_folder, num_workers=1)
-
         # Get a Git object
         self.git_repo = Git(self.repo_folder)
-        self.total_commits = self.git_repo.total_commits()
+        self.head = self.git_repo.repo.head.commit.hexsha
+
+        # Get a Repository object, restricted to the analyzed window
+        self.mining_parameters = {'since': since, 'until': until, 'last_n_commits': last_n_commits}
+        window = self._mining_window(since, until, last_n_commits)
+        self.repository_mining = Repository(self.repo_folder, num_workers=1, **window,
+                **self.commit_filter.repository_parameters())
+        self.total_commits = self._count_commits(since, until, last_n_commits)
 
         # Get url to all files
         self.active_branch = None
@@ -65,44 +95,296 @@ class Analyzer:
         self.commits_hashes = []
 
         # Get list of files
-        self.forbidden_file_extensions = ['.zip', '.gif', '.png']
+        self.list_repo_files()
+        
+        self.old_to_new_path = {}
+        self.init_time = None
+        self._files_counts = None
+        if mine_history:
+            self.mine_history()
+
+        self.df = None
+        self.commit_to_files = {}
+        self.files_modification_dates = {}
+
+        self.distance_matrix = None
+
+        self.couplings_type = None
+        self.template_suffix = ''
+
+        # Remove temp folder at end of execution
+        register(self._cleanup)
+
+    def list_repo_files(self):
+        """ Lists the analyzed files of the working tree of the repo.
+        """
+
         repo_files_paths = self.git_repo.files()
         self.path_prefix = path.commonpath(repo_files_paths)
         self.repo_files_path = []
 
         for file_path in repo_files_paths:
-            _, file_extension = path.splitext(file_path)
-            if file_extension not in self.forbidden_file_extensions:
-                file_path = file_path[len(self.path_prefix)+1:]
+            file_path = file_path[len(self.path_prefix)+1:]
+            if self.commit_filter.accept_path(file_path) and self.commit_filter.in_focus(file_path):
                 self.repo_files_path.append(file_path)
-        
-        # Find earlier names and paths of these files
-        self.old_to_new_path = {}
+        self.repo_files_set = set(self.repo_files_path)
+
+        self.number_files = len(set(self.get_node(file_path) for file_path in self.repo_files_path))
+
+    def record_commit(self, commit):
+        """ Returns the CommitRecord of a pydriller Commit, None if the commit is filtered out.
+        Stores the earlier paths of the files renamed by the commit.
+        """
+
+        # Checked before commit.modified_files, which computes the diff of the commit
+        if not self.commit_filter.accept_commit(commit, self.count_modified_files):
+            # Bulk commits are often directory moves, the files must keep their history
+            self.record_renames(commit)
+            return None
+
+        modified_paths = []
+        for modification in commit.modified_files:
+            if not self.commit_filter.accept_path(modification.new_path or modification.old_path):
+                continue
+            modified_paths.append(modification.new_path)
+            if modification.old_path != modification.new_path and modification.old_path is not None:
+                self.old_to_new_path[modification.old_path] = modification.new_path
+
+        return CommitRecord(commit.hash, commit.committer_date, modified_paths, len(modified_paths))
+
+    def count_modified_files(self, commit):
+        """ Returns the number of files modified by a commit since its first parent, like pydriller's
+        Commit.files but from the trees of the commits only, without diffing the files.
+        A renamed file counts twice.
+        """
+
+        if self._files_counts is None:
+            self._files_counts = self._list_files_counts()
+
+        if commit.hash in self._files_counts:
+            return self._files_counts[commit.hash]
+
+        # Commits fetched after the mining
+        if len(commit.parents) == 0:
+            names = self.git_repo.repo.git.diff_tree('-r', '-z', '--root', '--no-commit-id', '--name-only', commit.hash)
+        else:
+            names = self.git_repo.repo.git.diff_tree('-r', '-z', '--name-only', commit.parents[0], commit.hash)
+
+        return len([name for name in names.split('\0') if name != ''])
+
+    def _list_files_counts(self):
+        """ Returns a dict hash -> number of modified files for all the commits of the analyzed window,
+        listed by a single git log.
+        """
+
+        since, until, last_n_commits = (self.mining_parameters[key] for key in ('since', 'until', 'last_n_commits'))
+        try:
+            # \x01 starts the entry of each commit : its hash then the names of its files, separated by NUL characters
+            log = self.git_repo.repo.git.log('--no-renames', '--diff-merges=first-parent', '--name-only', '-z',
+                    '--format=%x01%H', *self._rev_list_arguments(since, until, last_n_commits))
+        except GitCommandError:
+            # git older than 2.31, the commits are counted one by one
+            return {}
+
+        files_counts = {}
+        for entry in log.split('\x01')[1:]:
+            fields = entry.split('\0')
+            files_counts[fields[0]] = len([name for name in fields[1:] if name.strip() != ''])
+
+        return files_counts
+
+    def record_renames(self, commit):
+        """ Stores the earlier paths of the files renamed by a filtered commit.
+        Only the names of the renamed files are asked to git, which is much cheaper than the diff of the commit.
+        """
+
+        # Like pydriller, merge commits have no modified files
+        if commit.merge:
+            return
+
+        # -z gives the paths unquoted, separated by NUL characters : status, path or status, old path, new path
+        fields = self.git_repo.repo.git.diff_tree('-r', '-M', '-z', '--name-status', '--no-commit-id', commit.hash).split('\0')
+        i = 0
+        while i < len(fields) - 1:
+            status = fields[i]
+            if status.startswith(('R', 'C')):
+                old_path, new_path = fields[i+1], fields[i+2]
+                if status.startswith('R') and self.commit_filter.accept_path(new_path):
+                    self.old_to_new_path[path.normpath(old_path)] = path.normpath(new_path)
+                i += 3
+            else:
+                i += 2
+
+    @profiled('rename resolution')
+    def mine_history(self):
+        """ Traverses the commits of the repo to store the modified files of each commit
+        and find earlier names and paths of the files.
+        """
+
         pbar = tqdm(total=self.total_commits)
         start_time = time()
+        filtered_commits = 0
         for commit in self.repository_mining.traverse_commits():
-            self.commits.append(commit)
-            self.commits_hashes.append(commit.hash)
-            for modification in commit.modified_files:
-                if modification.old_path != modification.new_path and modification.old_path is not None:
-                    self.old_to_new_path[modification.old_path] = modification.new_path
             pbar.update(1)
+
+            record = self.record_commit(commit)
+            if record is None:
+                filtered_commits += 1
+                continue
+
+            self.commits.append(record)
+            self.commits_hashes.append(commit.hash)
         self.init_time = time() - start_time
         pbar.close()
         self.commits_hashes.reverse()
 
-        self.df = None
-        self.commit_to_files = {}
-        self.files_modification_dates = {}
+        get_profiler().count('filtered commits', filtered_commits)
+        if self.init_time > 0:
+            get_profiler().count('commits/s', (len(self.commits) + filtered_commits) / self.init_time)
 
-        self.distance_matrix = None
+    def fetch_new_commits(self):
+        """ Fetches the repo and moves the working tree to its new HEAD.
+        Returns the hashes of the new commits, oldest first, or None if the history
+        was rewritten and the new HEAD does not descend from the analyzed one.
+        """
 
-        self.couplings_type = None
+        repo = self.git_repo.repo
+        if self.is_remote:
+            repo.git.fetch('origin', self.active_branch)
+        else:
+            repo.git.fetch(path.abspath(self.url), 'HEAD')
+        new_head = repo.git.rev_parse('FETCH_HEAD')
 
-        self.number_files = len(self.repo_files_path)
-        
-        # Remove temp folder at end of execution
-        register(self._cleanup)
+        if new_head == self.head:
+            return []
+
+        try:
+            repo.git.merge_base('--is-ancestor', self.head, new_head)
+            new_hashes = repo.git.rev_list('--reverse', f'{self.head}..{new_head}').split()
+        except GitCommandError:
+            new_hashes = None
+
+        repo.git.reset('--hard', new_head)
+        self.head = new_head
+        self.list_repo_files()
+
+        return new_hashes
+
+    def mine_new_commits(self, hashes):
+        """ Mines the new commits given by fetch_new_commits and appends them to the history.
+        The commits leaving the analyzed window are removed.
+        Returns the CommitRecords of the new commits and the hashes of the removed ones.
+        """
+
+        repository_mining = Repository(self.repo_folder, only_commits=hashes, num_workers=1,
+                **self.commit_filter.repository_parameters())
+        new_commits = []
+        for commit in repository_mining.traverse_commits():
+            record = self.record_commit(commit)
+            if record is not None:
+                new_commits.append(record)
+
+        self.commits += new_commits
+        self.commits_hashes = [commit.hash for commit in reversed(new_commits)] + self.commits_hashes
+
+        since, until, last_n_commits = (self.mining_parameters[key] for key in ('since', 'until', 'last_n_commits'))
+        removed_hashes = []
+        if last_n_commits is not None:
+            window = set(self.git_repo.repo.git.rev_list(*self._rev_list_arguments(since, until, last_n_commits)).split())
+            removed_hashes = [commit.hash for commit in self.commits if commit.hash not in window]
+            self.commits = [commit for commit in self.commits if commit.hash in window]
+            self.commits_hashes = [commit_hash for commit_hash in self.commits_hashes if commit_hash in window]
+        self.total_commits = self._count_commits(since, until, last_n_commits)
+
+        return new_commits, removed_hashes
+
+    def get_history(self):
+        """ Returns the results of the history mining, to be stored in a checkpoint.
+        """
+
+        return {
+            'old_to_new_path': self.old_to_new_path,
+            'commits': self.commits,
+            'commits_hashes': self.commits_hashes,
+            'init_time': self.init_time
+            }
+
+    def set_history(self, history):
+        """ Restores the results of a previous history mining.
+        """
+
+        self.old_to_new_path = history['old_to_new_path']
+        self.commits = history['commits']
+        self.commits_hashes = history['commits_hashes']
+        self.init_time = history['init_time']
+
+    def get_couplings_data(self):
+        """ Returns the results of compute_couplings, as objects and dataframes to be stored in a checkpoint.
+        """
+
+        objects = {
+            'commit_to_files': self.commit_to_files,
+            'files_modification_dates': self.files_modification_dates
+            }
+        frames = {'df': self.df}
+
+        return objects, frames
+
+    def set_couplings_data(self, data):
+        """ Restores the results of a previous compute_couplings.
+        """
+
+        self.commit_to_files = data['commit_to_files']
+        self.files_modification_dates = data['files_modification_dates']
+        self.df = data['df']
+
+    def get_distance_data(self):
+        """ Returns the results of get_distance_matrix, as dataframes to be stored in a checkpoint.
+        """
+
+        return {'distance_matrix': self.distance_matrix}
+
+    def set_distance_data(self, data):
+        """ Restores the results of a previous get_distance_matrix.
+        """
+
+        self.distance_matrix = data['distance_matrix']
+
+    def _rev_list_arguments(self, since, until, last_n_commits):
+
+        arguments = []
+        if last_n_commits is not None:
+            arguments += ['--max-count', str(last_n_commits)]
+        if since is not None:
+            arguments += ['--since', since.isoformat()]
+        if until is not None:
+            arguments += ['--until', until.isoformat()]
+
+        return arguments + ['HEAD']
+
+    def _mining_window(self, since, until, last_n_commits):
+        """ Returns the arguments of the Repository object restricting the mining to the window.
+        """
+
+        # With merges, the last n commits are not the commits following the oldest of them
+        if last_n_commits is not None:
+            hashes = self.git_repo.repo.git.rev_list(*self._rev_list_arguments(since, until, last_n_commits)).split()
+            return {'only_commits': hashes}
+
+        window = {}
+        if since is not None:
+            window['since'] = since
+        if until is not None:
+            window['to'] = until
+
+        return window
+
+    def _count_commits(self, since, until, last_n_commits):
+
+        if since is None and until is None and last_n_commits is None:
+            return self.git_repo.total_commits()
+
+        return int(self.git_repo.repo.git.rev_list('--count', *self._rev_list_arguments(since, until, last_n_commits)))
 
     @staticmethod
     def _is_remote_repository(repo: str) -> bool:
@@ -121,6 +403,19 @@ class Analyzer:
 
         return repo_folder
 
+    def _update_cached_clone(self, cache_folder: str, repo: str) -> str:
+        """ Clones the remote repo in cache_folder, or pulls it if it was already cloned.
+        """
+
+        repo_folder = path.join(cache_folder, self._get_repo_id_from_url(repo))
+
+        if path.exists(path.join(repo_folder, '.git')):
+            Repo(repo_folder).remotes.origin.pull()
+        else:
+            Repo.clone_from(url=repo, to_path=repo_folder)
+
+        return repo_folder
+
     def _clone_local_repository(self, path_to_tmp_folder: str, path_to_repo: str) -> str:
         """Clones a local repository to a temp folder
         """
@@ -154,12 +449,23 @@ class Analyzer:
 
         return url[last_slash_index + 1:last_suffix_index]
 
+    @classmethod
+    def _get_repo_id_from_url(cls, url: str) -> str:
+        """ Returns the name of the repo followed by a hash of its url, which avoids collisions
+        between repos with the same name in the files saved for each repo.
+        """
+
+        if not cls._is_remote_repository(url):
+            url = path.abspath(url)
+        url_hash = sha1(url.encode('utf-8')).hexdigest()[:8]
+
+        return f'{cls._get_repo_name_from_url(url)}_{url_hash}'
+
     def _cleanup(self):
         """ Cleanup temporary folder at the end of execution.
         """
 
-        if self._is_remote_repository(self.url):
-            assert self._tmp_dir is not None
+        if self._is_remote_repository(self.url) and self._tmp_dir is not None:
             try:
                 self._tmp_dir.cleanup()
             except PermissionError:
@@ -168,6 +474,7 @@ class Analyzer:
                 # In this case, just ignore the errors.
                 rmtree(self._tmp_dir.name, ignore_errors=True)
 
+    @profiled('incidence build')
     def run_general_analysis(self,
             get_logical_couplings_df=False,
             get_commit_to_files=False,
@@ -181,23 +488,16 @@ class Analyzer:
 
             columns.append(commit.hash)
 
-            modified_files = []
-            for modification in commit.modified_files:
-
-                current_path = self.get_current_path(modification.new_path)
+            modified_files = self.get_modified_nodes(commit)
+            for current_path in modified_files:
 
-                if current_path is not None:
+                # Update files_modification_dates
+                if get_dates:
+                    self.update_files_modification_dates(commit, current_path)
 
-                    modified_files.append(current_path)
-
-                    # Update files_modification_dates
-                    if get_dates:
-                        self.update_files_modification_dates(commit, current_path)
-
-                    # Updating dataframe data
-                    if get_logical_couplings_df:
-                        if self.remove_bulk == -1 or len(commit.modified_files) < self.remove_bulk:
-                            self.update_logical_couplings_df_data(current_path, files_commits, i)
+                # Updating dataframe data
+                if get_logical_couplings_df:
+                    self.update_logical_couplings_df_data(current_path, files_commits, i)
 
             if get_commit_to_files:
                 self.commit_to_files[commit.hash] = modified_files
@@ -205,6 +505,50 @@ class Analyzer:
         # Create dataframe
         if get_logical_couplings_df:
             self.create_logical_couplings_df(files_commits, i, columns)
+            get_profiler().count('incidence nnz', lambda: int((self.df.to_numpy() != 0).sum()))
+
+    def update_couplings(self, new_commits=None):
+        """ Appends the new commits given by mine_new_commits to the results of compute_couplings.
+        If new_commits is None, everything is computed again from the history.
+        """
+
+        if new_commits is None:
+            self.commit_to_files = {}
+            self.files_modification_dates = {}
+            self.compute_couplings()
+            return
+
+        # setup_visualization_data adds the number of commits of each file to the dataframe
+        self.df = self.df.drop(columns='sum', errors='ignore')
+
+        columns = {}
+        for commit in new_commits:
+            modified_files = self.get_modified_nodes(commit)
+            for current_path in modified_files:
+                self.update_files_modification_dates(commit, current_path)
+            self.commit_to_files[commit.hash] = modified_files
+            columns[commit.hash] = Series(1, index=modified_files, dtype=int)
+
+        if len(columns) > 0:
+            self.df = concat([self.df, DataFrame(columns)], axis=1).fillna(0).astype(int)
+
+    def get_modified_nodes(self, commit):
+        """ Returns the current nodes of the files modified by a commit, without the deleted files.
+        """
+
+        modified_files = []
+        for modified_path in commit.modified_paths:
+
+            current_path = self.get_current_path(modified_path)
+            if current_path is None or not self.commit_filter.in_focus(current_path):
+                continue
+            current_path = self.get_node(current_path)
+
+            # Several files of a commit can belong to the same directory
+            if current_path not in modified_files:
+                modified_files.append(current_path)
+
+        return modified_files
 
     def update_files_modification_dates(self, commit, current_path):
 
@@ -241,8 +585,53 @@ class Analyzer:
         
         self.df = DataFrame(dataframe_list, index=index, columns=columns)
 
+    def get_node(self, file_path):
+        """ Returns the node of the analysis a file belongs to : the file itself, or its directory
+        at directory_depth if the files are aggregated.
+        """
+
+        if self.directory_depth is None:
+            return file_path
+
+        directories = file_path.replace('\\', '/').split('/')[:-1]
+        if len(directories) == 0:
+            return '.'
+
+        return '/'.join(directories[:self.directory_depth])
+
+    def get_nodes_suffix(self):
+        """ Returns a suffix describing the nodes of the analysis (directory depth and focused directory),
+        added to the names of the files saved for the repo so the different views do not overwrite each other.
+        """
+
+        suffix = ''
+        if self.directory_depth is not None:
+            suffix += f'_depth{self.directory_depth}'
+        if self.commit_filter.focus_directory is not None:
+            suffix += '_focus-' + self.commit_filter.focus_directory.replace('/', '-')
+
+        return suffix
+
+    def get_window_suffix(self):
+        """ Returns a suffix describing the analyzed window of the history (since, until, last_n_commits),
+        added to the names of the files saved for the repo so windowed runs do not overwrite full-history runs.
+        """
+
+        def format_date(date):
+            return f'{date:%Y-%m-%d}' if date.time() == datetime.min.time() else f'{date:%Y-%m-%dT%H-%M-%S}'
+
+        suffix = ''
+        if self.mining_parameters['since'] is not None:
+            suffix += '_since-' + format_date(self.mining_parameters['since'])
+        if self.mining_parameters['until'] is not None:
+            suffix += '_until-' + format_date(self.mining_parameters['until'])
+        if self.mining_parameters['last_n_commits'] is not None:
+            suffix += f"_last-{self.mining_parameters['last_n_commits']}"
+
+        return suffix
+
     def get_current_path(self, path):
-        if path in self.repo_files_path:
+        if path in self.repo_files_set:
             current_path = path
         else:
             current_path = self.retrieve_current_path(path)
@@ -257,7 +646,7 @@ class Analyzer:
         path = old_path
         detect_endless_loop = 0
 
-        while path is not None and path not in self.repo_files_path and detect_endless_loop < 50:
+        while path is not None and path not in self.repo_files_set and detect_endless_loop < 50:
             if path in self.old_to_new_path:
                 path = self.old_to_new_path[path]
             else:
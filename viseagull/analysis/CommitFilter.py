@@ -0,0 +1,94 @@
+from fnmatch import fnmatch
+
+
+class CommitFilter:
+
+    def __init__(self, max_files=-1, max_lines=-1, skip_merges=False, include_paths=None, exclude_paths=None,
+            exclude_authors=None, focus_directory=None) -> None:
+        """ Filters the commits and files during the mining of the history. Commits are filtered
+        before their diff is computed (except to count their lines with max_lines), so filtered commits
+        cost almost nothing : only their renames are still recorded.
+
+        Attributes :
+            max_files : commits modifying at least max_files files are ignored (-1 to keep all commits)
+            max_lines : commits modifying at least max_lines lines are ignored (-1 to keep all commits)
+            skip_merges : if True, merge commits are ignored
+            include_paths : list of glob patterns, if given only the matching files are analyzed
+            exclude_paths : list of glob patterns of files that are not analyzed
+            exclude_authors : list of names or emails of authors whose commits are ignored
+            focus_directory : if given, only the files of this directory are analyzed
+        """
+
+        self.max_files = max_files
+        self.max_lines = max_lines
+        self.skip_merges = skip_merges
+        self.include_paths = include_paths if include_paths is not None else []
+        self.exclude_paths = exclude_paths if exclude_paths is not None else ['*.zip', '*.gif', '*.png']
+        self.exclude_authors = exclude_authors if exclude_authors is not None else []
+        self.focus_directory = focus_directory.replace('\\', '/').strip('/') if focus_directory is not None else None
+
+    def parameters(self):
+        """ Returns the parameters of the filter applied during the mining, used in the history checkpoints keys.
+        The focused directory is not one of them, the mined history is shared by all the focused analyses.
+        """
+
+        return {
+            'max_files': self.max_files,
+            'max_lines': self.max_lines,
+            'skip_merges': self.skip_merges,
+            'include_paths': self.include_paths,
+            'exclude_paths': self.exclude_paths,
+            'exclude_authors': self.exclude_authors
+            }
+
+    def repository_parameters(self):
+        """ Returns the arguments of the pydriller Repository applying the filter in git itself.
+        """
+
+        if self.skip_merges:
+            return {'only_no_merge': True}
+
+        return {}
+
+    def accept_commit(self, commit, count_files):
+        """ Checks a pydriller Commit, from the cheapest to the most expensive check. count_files returns
+        the number of files modified by the commit without diffing their contents, the contents are
+        only diffed to count the modified lines if max_lines is given.
+        """
+
+        if self.skip_merges and commit.merge:
+            return False
+
+        if len(self.exclude_authors) > 0 and (commit.author.name in self.exclude_authors
+                or commit.author.email in self.exclude_authors):
+            return False
+
+        if self.max_files != -1 and count_files(commit) >= self.max_files:
+            return False
+
+        if self.max_lines != -1 and commit.lines >= self.max_lines:
+            return False
+
+        return True
+
+    def accept_path(self, file_path):
+
+        if file_path is None:
+            return False
+
+        file_path = file_path.replace('\\', '/')
+
+        if len(self.include_paths) > 0 and not any(fnmatch(file_path, pattern) for pattern in self.include_paths):
+            return False
+
+        return not any(fnmatch(file_path, pattern) for pattern in self.exclude_paths)
+
+    def in_focus(self, file_path):
+        """ Checks that a file belongs to the focused directory. The focus is applied when the nodes of
+        the analysis are built, not during the mining.
+        """
+
+        if self.focus_directory is None:
+            return True
+
+        return file_path.replace('\\', '/').startswith(self.focus_directory + '/')
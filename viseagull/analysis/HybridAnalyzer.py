@@ -0,0 +1,65 @@
+from numpy import fill_diagonal
+from pandas import DataFrame
+
+from viseagull.profiler import get_profiler, profiled
+
+from .LogicalAnalyzer import LogicalAnalyzer
+from .SemanticAnalyzer import SemanticAnalyzer
+
+class HybridAnalyzer(LogicalAnalyzer, SemanticAnalyzer):
+
+    def __init__(self, url, remove_bulk=-1, hybrid_weight=0.5, **kwargs) -> None:
+        """ Computes the logical and semantic couplings from the same mining and corpus extraction.
+        The files are clustered with a weighted blend of both distances, and both distances are
+        kept to lay the cities out in each view.
+
+        Attributes :
+            hybrid_weight : weight of the logical distance in the blend, the semantic distance has 1 - hybrid_weight
+            views : dict view name -> distance matrix of the view, on the files of distance_matrix
+        """
+        super().__init__(url, remove_bulk, **kwargs)
+
+        self.couplings_type = 'hybrid'
+
+        self.hybrid_weight = hybrid_weight
+        self.views = {}
+
+    def compute_couplings(self):
+
+        # The semantic couplings also build the commits dataframe of the logical couplings
+        SemanticAnalyzer.compute_couplings(self)
+
+    @profiled('distance')
+    def get_distance_matrix(self):
+        """ Blends the logical and semantic distances on the files of both analyses.
+        A file missing from one of the analyses is not coupled to any file in it (distance 1).
+        """
+
+        logical_distance = LogicalAnalyzer.get_distance_matrix(self)
+        semantic_distance = SemanticAnalyzer.get_distance_matrix(self)
+
+        files = logical_distance.index.union(semantic_distance.index, sort=False)
+        self.views = {}
+        for view, distance in (('logical', logical_distance), ('semantic', semantic_distance)):
+            distance = distance.reindex(index=files, columns=files, fill_value=1.0).to_numpy()
+            fill_diagonal(distance, 0)
+            self.views[view] = DataFrame(distance, index=files, columns=files)
+
+        self.distance_matrix = (self.hybrid_weight * self.views['logical'] +
+                (1 - self.hybrid_weight) * self.views['semantic'])
+        get_profiler().count('distance nnz', lambda: int((self.distance_matrix.to_numpy() != 0).sum()))
+
+        return self.distance_matrix
+
+    def get_distance_data(self):
+
+        frames = super().get_distance_data()
+        for view, distance in self.views.items():
+            frames[f'{view}_distance_matrix'] = distance
+
+        return frames
+
+    def set_distance_data(self, data):
+
+        super().set_distance_data(data)
+        self.views = {view: data[f'{view}_distance_matrix'] for view in ('logical', 'semantic')}
@@ -1,12 +1,14 @@
 from pandas import DataFrame
 from sklearn.neighbors import DistanceMetric
 
+from viseagull.profiler import get_profiler, profiled
+
 from .Analyzer import Analyzer
 
 class LogicalAnalyzer(Analyzer):
 
-    def __init__(self, url, remove_bulk=-1) -> None:
-        super().__init__(url, remove_bulk)
+    def __init__(self, url, remove_bulk=-1, **kwargs) -> None:
+        super().__init__(url, remove_bulk, **kwargs)
 
         self.couplings_type = 'logical'
 
@@ -19,6 +21,7 @@ class LogicalAnalyzer(Analyzer):
             )
 
 
+    @profiled('distance')
     def get_distance_matrix(self):
         """ Computes a distance matrix using the jaccard distance on the inputed dataframe.
         """
@@ -29,5 +32,6 @@ class LogicalAnalyzer(Analyzer):
         distance_df = DataFrame(distance_matrix, index=self.df.index, columns=self.df.index)
 
         self.distance_matrix = distance_df
+        get_profiler().count('distance nnz', lambda: int((distance_matrix != 0).sum()))
 
         return distance_df
\ No newline at end of file
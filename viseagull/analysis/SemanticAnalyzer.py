@@ -1,5 +1,7 @@
+from os import path, cpu_count
 from ast import parse, walk, FunctionDef, ClassDef, Name
 from re import findall
+from concurrent.futures import ProcessPoolExecutor
 
 from math import log, sqrt
 
@@ -7,32 +9,110 @@ from pandas import DataFrame
 from nltk.stem import PorterStemmer
 from sklearn.metrics.pairwise import cosine_similarity
 
+from viseagull.profiler import get_profiler, profiled
+
 from .Analyzer import Analyzer
 
+# Number of files parsed by a task of the corpus extraction
+CORPUS_CHUNK_SIZE = 200
+
+def extract_identifiers(repo_folder, file_paths):
+    """ Get a list of identifiers of each file of file_paths.
+    Module level function so it can run in the worker processes of the corpus extraction.
+    """
+
+    file_to_identifiers = {}
+    for file_path in file_paths:
+
+
+        try :
+            with open(path.join(repo_folder, file_path)) as data_source:
+                ast_root = parse(data_source.read())
+                
+            identifiers = []
+
+            for node in walk(ast_root):
+                if isinstance(node, Name):
+                    identifiers.append(node.id)
+                elif isinstance(node, FunctionDef) or isinstance(node, ClassDef):
+                    identifiers.append(node.name)
+
+            file_to_identifiers[file_path] = identifiers
+
+        except:
+            print(f'Could not read {path.join(repo_folder, file_path)}')
+            pass
+    
+    return file_to_identifiers
+
 class SemanticAnalyzer(Analyzer):
 
-    def __init__(self, url, remove_bulk=-1) -> None:
-        super().__init__(url, remove_bulk)
+    def __init__(self, url, remove_bulk=-1, corpus_workers=None, **kwargs) -> None:
+        """ Computes the semantic couplings from the identifiers of the files of the current tree.
+
+        Attributes :
+            corpus_workers : maximum number of processes of the corpus extraction, number of CPUs if None
+            tf_idf_df : dataframe of the tf-idf vector of each file
+            file_to_identifiers : dict file path -> list of words of the file
+        """
+        super().__init__(url, remove_bulk, **kwargs)
 
         self.couplings_type = 'semantic'
 
+        self.corpus_workers = corpus_workers
         self.tf_idf_df = None
         self.file_to_identifiers = None
 
+        self._corpus_executor = None
+        self._corpus_futures = None
+
+    def start_corpus_extraction(self):
+        """ Starts the corpus extraction in worker processes, so the files of the current tree
+        are parsed while the history is mined. get_corpus waits for the results.
+        """
+
+        chunks = [self.repo_files_path[i:i + CORPUS_CHUNK_SIZE]
+                for i in range(0, len(self.repo_files_path), CORPUS_CHUNK_SIZE)]
+        if len(chunks) == 0:
+            return
+
+        workers = min(self.corpus_workers or cpu_count() or 1, len(chunks))
+        self._corpus_executor = ProcessPoolExecutor(max_workers=workers)
+        self._corpus_futures = [self._corpus_executor.submit(extract_identifiers, self.repo_folder, chunk)
+                for chunk in chunks]
+        get_profiler().count('corpus workers', workers)
+
+    def cancel_corpus_extraction(self):
+        """ Stops the extraction started by start_corpus_extraction when its results will not be used,
+        e.g. when the mining fails. The chunks already being parsed are waited for.
+        """
+
+        if self._corpus_executor is None:
+            return
+
+        for future in self._corpus_futures:
+            future.cancel()
+        self._corpus_executor.shutdown()
+        self._corpus_executor = None
+        self._corpus_futures = None
+
     def compute_couplings(self):
         
-        self.file_to_identifiers = self.get_corpus()
+        self.file_to_identifiers = self.aggregate_corpus(self.get_corpus())
 
-        self.preprocess_words(self.file_to_identifiers)
+        with get_profiler().span('TF-IDF'):
 
-        voc_size, voc_to_index = self.compute_voc(self.file_to_identifiers)
+            self.preprocess_words(self.file_to_identifiers)
 
-        tf = self.compute_tf(voc_to_index, self.file_to_identifiers)
-        idf = self.compute_idf(voc_to_index, self.file_to_identifiers)
-        tf_idf = self.compute_tf_idf(voc_to_index, tf, idf)
+            voc_size, voc_to_index = self.compute_voc(self.file_to_identifiers)
 
+            tf = self.compute_tf(voc_to_index, self.file_to_identifiers)
+            idf = self.compute_idf(voc_to_index, self.file_to_identifiers)
+            tf_idf = self.compute_tf_idf(voc_to_index, tf, idf)
 
-        self.tf_idf_df = DataFrame.from_dict(tf_idf, orient='index')
+
+            self.tf_idf_df = DataFrame.from_dict(tf_idf, orient='index')
+            get_profiler().count('vocabulary size', voc_size)
 
         self.run_general_analysis(
             get_logical_couplings_df=True,
@@ -42,46 +122,70 @@ class SemanticAnalyzer(Analyzer):
 
         
 
+    def update_couplings(self, new_commits=None):
+
+        # The identifiers of the files change with the new commits, the corpus is extracted again
+        super().update_couplings()
+
+    @profiled('distance')
     def get_distance_matrix(self):
         
-        distance_matrix = cosine_similarity(self.tf_idf_df)
+        distance_matrix = 1.0 - cosine_similarity(self.tf_idf_df)
         for i in range(len(distance_matrix)):
-            distance_matrix[i][i] = 1
+            distance_matrix[i][i] = 0
         distance_df = DataFrame(distance_matrix, index=self.tf_idf_df.index, columns=self.tf_idf_df.index)
 
         self.distance_matrix = distance_df
+        get_profiler().count('distance nnz', lambda: int((distance_matrix != 0).sum()))
 
         return distance_df
     
-    def get_corpus(self):
-        """ Get a list of identifiers of each file in a repo.
-        """
+    def get_couplings_data(self):
 
-        file_to_identifiers = {}
-        for file_path in self.repo_files_path:
+        objects, frames = super().get_couplings_data()
+        frames['tf_idf_df'] = self.tf_idf_df
 
+        return objects, frames
 
-            try :
-                with open(self.repo_folder + '\\' + file_path) as data_source:
-                    ast_root = parse(data_source.read())
-                    
-                identifiers = []
+    def set_couplings_data(self, data):
 
-                for node in walk(ast_root):
-                    if isinstance(node, Name):
-                        identifiers.append(node.id)
-                    elif isinstance(node, FunctionDef) or isinstance(node, ClassDef):
-                        identifiers.append(node.name)
+        super().set_couplings_data(data)
+        self.tf_idf_df = data['tf_idf_df']
 
-                file_to_identifiers[file_path] = identifiers
+    @profiled('corpus extraction')
+    def get_corpus(self):
+        """ Get a list of identifiers of each file in a repo, joining the extraction started
+        by start_corpus_extraction if there is one.
+        """
+
+        if self._corpus_futures is None:
+            return extract_identifiers(self.repo_folder, self.repo_files_path)
 
-            except:
-                path = self.repo_folder + "\\" + file_path
-                print(f'Could not read {path}')
-                pass
+        file_to_identifiers = {}
+        try:
+            # Chunks are joined in order, the corpus is the same as a sequential extraction
+            for future in self._corpus_futures:
+                file_to_identifiers.update(future.result())
+        finally:
+            self._corpus_executor.shutdown()
+            self._corpus_executor = None
+            self._corpus_futures = None
         
         return file_to_identifiers
 
+    def aggregate_corpus(self, file_to_identifiers):
+        """ Merges the identifiers of the files belonging to the same node of the analysis.
+        """
+
+        if self.directory_depth is None:
+            return file_to_identifiers
+
+        node_to_identifiers = {}
+        for file_path, identifiers in file_to_identifiers.items():
+            node_to_identifiers.setdefault(self.get_node(file_path), []).extend(identifiers)
+
+        return node_to_identifiers
+
     def preprocess_words(self, file_to_identifiers):
         """ Preprocess words for further analysis : stems, split and lower words.
         """
@@ -0,0 +1,119 @@
+from numpy import zeros, ix_, flatnonzero, errstate, where
+from pandas import DataFrame
+
+
+class SlidingWindow:
+
+    def __init__(self, analyzer, window, step) -> None:
+        """ Computes the logical couplings of successive windows of the history of a repo.
+        The co-change counts are updated by adding the commits entering the window and
+        subtracting the commits leaving it, so the whole series costs one pass over the history.
+
+        Attributes :
+            analyzer : Analyzer whose compute_couplings has been run on the full history
+            window : timedelta, duration of a window
+            step : timedelta, duration between the start of two windows
+            incidence : files x commits binary matrix of the full history
+            files : list of files, rows of incidence
+            commits_dates : committer date of each column of incidence
+            file_counts : number of commits of the window modifying each file
+            pair_counts : number of commits of the window modifying each pair of files
+        """
+
+        self.analyzer = analyzer
+        self.window = window
+        self.step = step
+
+        df = analyzer.df.drop(columns=['sum'], errors='ignore')
+        self.incidence = df.to_numpy() != 0
+        self.files = df.index.tolist()
+        self.commits = df.columns.tolist()
+        commit_to_date = {commit.hash: commit.committer_date for commit in analyzer.commits}
+        self.commits_dates = [commit_to_date[commit_hash] for commit_hash in self.commits]
+
+        self.full_commit_to_files = analyzer.commit_to_files
+        self.full_commits_hashes = analyzer.commits_hashes
+
+        self.file_counts = zeros(len(self.files), dtype=int)
+        self.pair_counts = zeros((len(self.files), len(self.files)), dtype=int)
+
+    def add_commit(self, column):
+
+        modified = flatnonzero(self.incidence[:, column])
+        self.file_counts[modified] += 1
+        self.pair_counts[ix_(modified, modified)] += 1
+
+    def remove_commit(self, column):
+
+        modified = flatnonzero(self.incidence[:, column])
+        self.file_counts[modified] -= 1
+        self.pair_counts[ix_(modified, modified)] -= 1
+
+    def windows(self):
+        """ Yields the (start, end, columns) of each window, with the counts updated for this window.
+        """
+
+        if len(self.commits_dates) == 0:
+            return
+
+        start = self.commits_dates[0]
+        last_date = self.commits_dates[-1]
+        first_column = 0
+        last_column = 0
+
+        while True:
+
+            end = start + self.window
+
+            while last_column < len(self.commits) and self.commits_dates[last_column] < end:
+                self.add_commit(last_column)
+                last_column += 1
+            while first_column < last_column and self.commits_dates[first_column] < start:
+                self.remove_commit(first_column)
+                first_column += 1
+
+            yield start, end, list(range(first_column, last_column))
+
+            if end > last_date:
+                break
+            start = start + self.step
+
+    def distance_matrix(self, active):
+        """ Jaccard distance between the active files of the window, from the co-change counts.
+        """
+
+        pair_counts = self.pair_counts[ix_(active, active)]
+        file_counts = self.file_counts[active]
+        union = file_counts[:, None] + file_counts[None, :] - pair_counts
+
+        with errstate(divide='ignore', invalid='ignore'):
+            distance_matrix = where(union > 0, 1 - pair_counts / union, 1.0)
+        for i in range(len(active)):
+            distance_matrix[i][i] = 0
+
+        files = [self.files[i] for i in active]
+
+        return DataFrame(distance_matrix, index=files, columns=files)
+
+    def apply(self, start, end, columns):
+        """ Sets the data of the analyzer to the data of the window. Returns False if the window has
+        too few modified files to be analyzed.
+        """
+
+        active = flatnonzero(self.file_counts > 0)
+        if len(active) < 2:
+            return False
+
+        window_commits = [self.commits[column] for column in columns]
+        window_commits_set = set(window_commits)
+
+        self.analyzer.df = DataFrame(self.incidence[ix_(active, columns)].astype(int),
+                index=[self.files[i] for i in active], columns=window_commits)
+        self.analyzer.distance_matrix = self.distance_matrix(active)
+        self.analyzer.commit_to_files = {commit_hash: files for commit_hash, files in self.full_commit_to_files.items()
+                if commit_hash in window_commits_set}
+        self.analyzer.commits_hashes = [commit_hash for commit_hash in self.full_commits_hashes
+                if commit_hash in window_commits_set]
+        self.analyzer.template_suffix = f'_{start:%Y-%m-%d}_{end:%Y-%m-%d}'
+
+        return True
@@ -1,19 +1,149 @@
+import logging
+
+from collections import Counter
+
 from sklearn.cluster import OPTICS, AgglomerativeClustering, Birch, DBSCAN
 
+from viseagull.profiler import profiled
+
 class Clusterer:
 
     def __init__(self, distance_matrix) -> None:
+        """ Attributes :
+            distance_matrix : dataframe of the distances between the files
+            clusters : dict label -> list of files
+            clusters_labels : label of each file, in the order of distance_matrix
+            clustering_parameters : arguments of cluster_dataframe, set by the subclasses
+        """
         
         self.distance_matrix = distance_matrix
         self.clusters = None
         self.clusters_labels = None
+        self.clustering_parameters = {}
 
     def compute_clustering(self):
-        pass
 
-    def cluster_dataframe(self, df, method='HDBSCAN', distance_matrix=True, min_size=2, eps=None, join_clusterless_samples=True):
+        self.clusters, self.clusters_labels = self.cluster_dataframe(self.distance_matrix, **self.clustering_parameters)
+
+    def compute_incremental_clustering(self, previous_labels, previous_distance_matrix, tolerance=0.05,
+            max_changed_fraction=0.3):
+        """ Only re-clusters the files whose couplings changed since the previous clustering, along
+        with the files of the clusters they belonged to or are coupled with. The other files keep
+        their previous label. Falls back to a full clustering if more than max_changed_fraction
+        of the files changed. Labels are matched with the previous ones to stay stable.
+
+        Parameters :
+            previous_labels : dict file -> label of the previous clustering
+            previous_distance_matrix : dataframe of the distances used by the previous clustering
+            tolerance : a file changed if one of its distances changed by more than tolerance
+            max_changed_fraction : fraction of changed files above which everything is re-clustered
+        """
+
+        files = self.distance_matrix.index.tolist()
+        changed = self.changed_files(previous_labels, previous_distance_matrix, tolerance)
+        logging.getLogger('viseagull').debug(f'{len(changed)} of {len(files)} files changed since the previous clustering')
+
+        if len(changed) > max_changed_fraction * len(files):
+            self.compute_clustering()
+            self.stabilize_labels(previous_labels)
+            return
+
+        # Files to re-cluster : changed files, their coupled files, and the clusters of both
+        distances = self.distance_matrix.to_numpy()
+        file_to_index = {file_name:i for i, file_name in enumerate(files)}
+        neighbourhood = set(changed)
+        for file_name in changed:
+            coupled = distances[file_to_index[file_name]] < 1
+            neighbourhood.update(files[i] for i in coupled.nonzero()[0])
+        affected_labels = set(previous_labels[file_name] for file_name in neighbourhood if file_name in previous_labels)
+        neighbourhood.update(file_name for file_name in files if previous_labels.get(file_name) in affected_labels)
+
+        labels = {file_name:previous_labels[file_name] for file_name in files if file_name not in neighbourhood}
+
+        neighbourhood = [file_name for file_name in files if file_name in neighbourhood]
+        if len(neighbourhood) > 1:
+            sub_matrix = self.distance_matrix.loc[neighbourhood, neighbourhood]
+            _, sub_labels = self.cluster_dataframe(sub_matrix, **self.clustering_parameters)
+            labels.update(self.match_labels(dict(zip(neighbourhood, sub_labels)), previous_labels,
+                    used_labels=set(labels.values())))
+        elif len(neighbourhood) == 1:
+            labels.update(self.match_labels({neighbourhood[0]: 0}, previous_labels, used_labels=set(labels.values())))
+
+        self.set_labels(labels)
+
+    def changed_files(self, previous_labels, previous_distance_matrix, tolerance):
+        """ Returns the files that are new, or whose distances to the files of the previous
+        clustering changed by more than tolerance.
+        """
+
+        files = self.distance_matrix.index.tolist()
+        common = [file_name for file_name in files
+                if file_name in previous_labels and file_name in previous_distance_matrix.index]
+        changed = [file_name for file_name in files if file_name not in previous_labels
+                or file_name not in previous_distance_matrix.index]
+
+        if len(common) > 0:
+            difference = abs(self.distance_matrix.loc[common, common].to_numpy()
+                    - previous_distance_matrix.loc[common, common].to_numpy())
+            changed += [common[i] for i in (difference.max(axis=1) > tolerance).nonzero()[0]]
+
+        return changed
+
+    @staticmethod
+    def match_labels(new_labels, previous_labels, used_labels=None):
+        """ Renames the labels of new_labels (dict file -> label) to the previous label sharing the
+        most files with them. Clusters without a match get a label never used before.
+        """
+
+        used_labels = set() if used_labels is None else set(used_labels)
+
+        overlaps = Counter()
+        for file_name, label in new_labels.items():
+            if file_name in previous_labels:
+                overlaps[(label, previous_labels[file_name])] += 1
+
+        mapping = {}
+        for (label, previous_label), _ in overlaps.most_common():
+            if label not in mapping and previous_label not in used_labels:
+                mapping[label] = previous_label
+                used_labels.add(previous_label)
+
+        all_labels = used_labels | set(previous_labels.values())
+        next_label = max(all_labels) + 1 if len(all_labels) > 0 else 0
+        for label in sorted(set(new_labels.values())):
+            if label not in mapping:
+                mapping[label] = next_label
+                next_label += 1
+
+        return {file_name:mapping[label] for file_name, label in new_labels.items()}
+
+    def stabilize_labels(self, previous_labels):
+        """ Renames the labels of the current clustering to match the previous clustering.
+        """
+
+        files = self.distance_matrix.index.tolist()
+        self.set_labels(self.match_labels(dict(zip(files, self.clusters_labels)), previous_labels))
+
+    def set_labels(self, labels):
+        """ Sets clusters and clusters_labels from a dict file -> label.
+        """
+
+        self.clusters_labels = []
+        self.clusters = {}
+        for file_name in self.distance_matrix.index:
+            label = int(labels[file_name])
+            self.clusters_labels.append(label)
+            self.clusters.setdefault(label, []).append(file_name)
+
+    @profiled('clustering')
+    def cluster_dataframe(self, df, method='HDBSCAN', distance_matrix=True, min_size=2, eps=None, join_clusterless_samples=True,
+            distance_threshold=0.95):
         """ Clusters a dataframe using a given method.
         """
+
+        # The clustering algorithms need at least two samples, e.g. a single focused directory
+        if len(df) < 2:
+            return {0: df.index.tolist()}, [0] * len(df)
         
         if method == 'OPTICS':
 
@@ -32,7 +162,7 @@ class Clusterer:
                         n_clusters=None,
                         affinity='precomputed',
                         linkage='average',
-                        distance_threshold=0.95)
+                        distance_threshold=distance_threshold)
             else:
                 clusterer = AgglomerativeClustering(
                         n_clusters=None,
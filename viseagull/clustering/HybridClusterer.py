@@ -0,0 +1,33 @@
+from numpy import eye, median
+
+from .Clusterer import Clusterer
+
+# Distance threshold of the agglomerative clustering of the logical couplings
+LOGICAL_DISTANCE_THRESHOLD = 0.95
+
+class HybridClusterer(Clusterer):
+
+    def __init__(self, distance_matrix, semantic_distance_matrix, hybrid_weight=0.5) -> None:
+        """ Clusters the blend of the logical and semantic distances with the agglomerative clustering
+        of the logical couplings. Most semantic distances are far below the threshold of the logical
+        couplings, so the threshold is blended with the same weight : files that never changed together
+        are only grouped if they are semantically closer than the median pair of files.
+
+        Attributes :
+            distance_threshold : threshold of the agglomerative clustering on the blended distances
+        """
+        super().__init__(distance_matrix)
+
+        semantic_distances = semantic_distance_matrix.to_numpy()
+        semantic_distances = semantic_distances[~eye(len(semantic_distances), dtype=bool)]
+        semantic_threshold = median(semantic_distances) if len(semantic_distances) > 0 else LOGICAL_DISTANCE_THRESHOLD
+        self.distance_threshold = float(hybrid_weight * LOGICAL_DISTANCE_THRESHOLD + (1 - hybrid_weight) * semantic_threshold)
+
+        self.clustering_parameters = {
+            'method': 'AggClustering',
+            'distance_matrix': True,
+            'min_size': 3,
+            'eps': 1,
+            'join_clusterless_samples': True,
+            'distance_threshold': self.distance_threshold
+            }
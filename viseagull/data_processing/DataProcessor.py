@@ -1,31 +1,191 @@
 import logging
+import json
 
+from os import path, makedirs, replace, getpid
+
+from numpy import random, asarray, zeros
 from sklearn import manifold
-from prince import MCA
 from pandas import DataFrame
 
+from viseagull.profiler import profiled
+from viseagull.data_processing.TemplateStore import TemplateStore
+
+LAYOUTS_FOLDER = './saved_layouts/'
+
+# Number of commits between two keyframes of the timeline
+TIMELINE_KEYFRAME_INTERVAL = 100
+# Types of the events of the timeline
+TIMELINE_APPEAR, TIMELINE_GROW, TIMELINE_RENAME = 0, 1, 2
+
 class DataProcessor:
 
-    def __init__(self, analyzer, clusterer) -> None:
+    def __init__(self, analyzer, clusterer, layout='tSNE', incremental=False, drift_threshold=0.2, view=None) -> None:
+        """ Attributes :
+            analyzer : Analyzer object holding the couplings data
+            clusterer : Clusterer object holding the clusters
+            layout : layout engine, one of 'tSNE', 'sparse-tSNE' or 'centroids'
+            incremental : if True, only new and changed files are placed, the others keep their previous position
+            drift_threshold : fraction of placed files after which a full layout is computed again
+            view : name of the distance matrix of analyzer.views used by the layout, None to use analyzer.distance_matrix
+            views_cities_data : dict view -> cities data laid out in another view, exported in the same payload
+            timeline : per commit deltas and keyframes of the buildings, for the history playback
+            previous_positions : dict file -> (x, y) saved by the previous run
+            previous_commits : dict file -> number of commits modifying the file at the previous run
+            previous_drift : fraction of files placed incrementally since the last full layout
+            df_reduced : positions computed by the layout engine
+            centroids_labels : cluster label of each row of df_reduced
+            template_name : name of the saved template, None if the template was not saved
+        """
 
         self.analyzer = analyzer
         self.clusterer = clusterer
+        self.layout = layout
+        self.incremental = incremental
+        self.drift_threshold = drift_threshold
+        self.view = view
+        self.views_cities_data = {}
+        self.timeline = None
         self.cluster_to_route = None
         self.cluster_centroid = None
         self.citiesData = []
+        self.template_name = None
+        self.df_reduced = None
+        self.centroids_labels = None
+        self.previous_positions = {}
+        self.previous_commits = {}
+        self.previous_drift = 0
+        self.load_layout()
         
 
-    def setup_visualization_data(self, save_data=False):
-        """Creates a file containing the data necessary for the visualization."""
+    @profiled('layout')
+    def compute_layout(self):
+        """ Computes the positions used to place the cities, using the chosen layout engine.
+        """
+
+        distance_matrix = self.get_distance_matrix()
 
-        df_reduced = self.dimensionality_reduction(self.analyzer.distance_matrix, method='tSNE')
+        df_reduced = None
+        if self.incremental:
+            df_reduced = self.incremental_placement(distance_matrix)
+
+        if df_reduced is not None:
+            centroids_labels = self.clusterer.clusters_labels
+            self.save_layout(df_reduced, drift=self.previous_drift)
+        elif self.layout == 'centroids':
+            df_reduced = self.centroids_reduction(distance_matrix, self.clusterer.clusters_labels)
+            centroids_labels = df_reduced.index.tolist()
+            self.save_layout(self.expand_centroids_positions(df_reduced,
+                    distance_matrix.index, self.clusterer.clusters_labels))
+        else:
+            df_reduced = self.dimensionality_reduction(distance_matrix, method=self.layout)
+            centroids_labels = self.clusterer.clusters_labels
+            self.save_layout(df_reduced)
+
+        self.df_reduced = df_reduced
+        self.centroids_labels = centroids_labels
+
+    @profiled('timeline')
+    def compute_timeline(self, keyframe_interval=TIMELINE_KEYFRAME_INTERVAL):
+        """ Precomputes the state of the buildings along the history, so the browser can show
+        any commit without replaying the history from the start.
+        Buildings and names get integer ids, the id of a building is the index of its file in
+        the cities, and the first names are the current names of the buildings. deltas has one flat list of events
+        [type, building id, value] per commit, oldest first : an appearance (value : name id,
+        height 1), a growth (value : height, the number of commits modifying the file so far)
+        or a rename (value : new name id). Every keyframe_interval commits, keyframes stores the
+        state after the commit as a flat list [building id, height, name id] of the buildings
+        already created, the state at any commit is then the closest keyframe plus at most
+        keyframe_interval deltas.
+        """
+
+        files = [building['fileName'] for city in self.citiesData for building in city['buildings']]
+        file_to_id = {file_name:i for i, file_name in enumerate(files)}
+        names = [str(file_name).replace('\\', '/') for file_name in files]
+        name_to_id = {name:i for i, name in enumerate(names)}
+
+        records = {commit.hash: commit for commit in self.analyzer.commits}
+        commits = [commit_hash for commit_hash in self.analyzer.df.columns if commit_hash != 'sum']
+
+        heights = {}
+        current_names = {}
+        deltas = []
+        keyframes = {}
+        for i, commit_hash in enumerate(commits):
+
+            events = []
+            modified_buildings = set()
+            for modified_path in records[commit_hash].modified_paths:
+
+                current_path = self.analyzer.get_current_path(modified_path)
+                if current_path is None or self.analyzer.get_node(current_path) not in file_to_id:
+                    continue
+                building_id = file_to_id[self.analyzer.get_node(current_path)]
+
+                # Several files of a commit can belong to the same directory
+                if building_id in modified_buildings:
+                    continue
+                modified_buildings.add(building_id)
+
+                # Name of the building at this commit, directories keep their name
+                name = modified_path.replace('\\', '/') if self.analyzer.directory_depth is None else names[building_id]
+                if name not in name_to_id:
+                    name_to_id[name] = len(names)
+                    names.append(name)
+                name_id = name_to_id[name]
+
+                if building_id not in heights:
+                    heights[building_id] = 1
+                    events += [TIMELINE_APPEAR, building_id, name_id]
+                else:
+                    heights[building_id] += 1
+                    events += [TIMELINE_GROW, building_id, heights[building_id]]
+                    if current_names[building_id] != name_id:
+                        events += [TIMELINE_RENAME, building_id, name_id]
+                current_names[building_id] = name_id
+
+            deltas.append(events)
+
+            if (i + 1) % keyframe_interval == 0:
+                keyframes[i] = [value for building_id in sorted(heights)
+                        for value in (building_id, heights[building_id], current_names[building_id])]
+
+        return {
+            'buildings': len(files),
+            'keyframeInterval': keyframe_interval,
+            'names': names,
+            'commits': commits,
+            'deltas': deltas,
+            'keyframes': keyframes
+            }
+
+    def get_distance_matrix(self):
+
+        if self.view is None:
+            return self.analyzer.distance_matrix
+
+        return self.analyzer.views[self.view]
+
+    def setup_visualization_data(self, save_data=False, write_visualization=True):
+        """Creates a file containing the data necessary for the visualization."""
 
         self.cluster_to_route = self.find_routes(self.clusterer.clusters, self.analyzer.df)
-        self.cluster_centroid = self.find_centroids(df_reduced, self.clusterer.clusters_labels)
+        self.citiesData = self.get_cities_data()
+        self.timeline = self.compute_timeline()
+
+        self.create_js_file(save_data, write_visualization)
+
+    def get_cities_data(self):
+        """ Returns the cities of the clusters, placed with the layout of the DataProcessor.
+        """
+
+        if self.df_reduced is None:
+            self.compute_layout()
+
+        self.cluster_centroid = self.find_centroids(self.df_reduced, self.centroids_labels)
         
-        self.analyzer.df["sum"] = self.analyzer.df.sum(axis=1)
+        self.analyzer.df["sum"] = self.analyzer.df.drop(columns=['sum'], errors='ignore').sum(axis=1)
 
-        self.citiesData = []
+        citiesData = []
         for key in self.clusterer.clusters.keys():
 
 
@@ -35,9 +195,9 @@ class DataProcessor:
             cityData['buildings'] = [{'height':self.analyzer.df.loc[name, "sum"], 'fileName':name} for name in self.clusterer.clusters[key] if name in list(self.analyzer.df.index)]
 
             if len(cityData['buildings']) > 0:
-                self.citiesData.append(cityData)
+                citiesData.append(cityData)
 
-        self.create_js_file(save_data)
+        return citiesData
 
 
 
@@ -45,13 +205,30 @@ class DataProcessor:
         """ Performs a dimensionality reduction on a given dataframe, using the given method.
         """
 
-        if method == 'tSNE':
-            tsne = manifold.TSNE(n_components=2, perplexity=5, metric='precomputed', square_distances=True)
+        if method in ('tSNE', 'sparse-tSNE') and len(df) == 1:
+            # Same position as a single cluster of centroids_reduction
+            embedded_data = [[1.0, 1.0]]
+
+        elif method in ('tSNE', 'sparse-tSNE'):
+
+            init = self.initial_positions(df)
+            optimization = {}
+            if method == 'sparse-tSNE' and isinstance(init, str):
+                # Shorter optimization, with a coarser Barnes-Hut approximation of the far files
+                optimization = {'n_iter': 500, 'angle': 0.8}
+            elif method == 'sparse-tSNE':
+                # The saved positions are only refined, the clusters are already separated
+                # so the early exaggeration is not needed
+                optimization = {'n_iter': 250, 'early_exaggeration': 1}
+
+            # tSNE requires fewer neighbours than files, e.g. for a few aggregated directories
+            tsne = manifold.TSNE(n_components=2, perplexity=min(5, len(df) - 1), metric='precomputed',
+                    square_distances=True, init=init, random_state=0, **optimization)
             embedded_data = tsne.fit_transform(df)
 
-        
         elif method == 'MCA':
-        
+
+            from prince import MCA
             df.replace({0: "False", 1: "True"}, inplace = True)
             mca = MCA(n_components=2)
             embedded_data = mca.fit_transform(df)
@@ -68,6 +245,168 @@ class DataProcessor:
 
         return df_embedded
 
+    def centroids_reduction(self, df, clusters_labels):
+        """ Embeds the clusters directly instead of the files. The distance between two clusters
+        is the average distance between their files.
+        """
+
+        labels = sorted(set(int(label) for label in clusters_labels))
+        label_to_index = {label:i for i, label in enumerate(labels)}
+
+        # Membership matrix, each row averages the files of a cluster
+        membership = zeros((len(labels), len(df)))
+        for i, label in enumerate(clusters_labels):
+            membership[label_to_index[int(label)], i] = 1
+        membership = membership / membership.sum(axis=1, keepdims=True)
+
+        clusters_distances = membership @ df.to_numpy() @ membership.T
+        for i in range(len(labels)):
+            clusters_distances[i][i] = 0
+
+        if len(labels) == 1:
+            embedded_data = [[1.0, 1.0]]
+        else:
+            init = None
+            known_files = [file_name in self.previous_positions for file_name in df.index]
+            if all(known_files):
+                init = membership @ asarray([self.previous_positions[file_name] for file_name in df.index])
+
+            mds = manifold.MDS(n_components=2, dissimilarity='precomputed', n_init=1, random_state=0)
+            embedded_data = mds.fit_transform(clusters_distances, init=init)
+
+        return DataFrame(embedded_data, index=labels)
+
+    @staticmethod
+    def expand_centroids_positions(df_centroids, files, clusters_labels):
+        """ Gives each file the position of its cluster.
+        """
+
+        rows = [df_centroids.loc[int(label)].tolist() for label in clusters_labels]
+
+        return DataFrame(rows, index=files)
+
+    def incremental_placement(self, df, n_neighbors=5):
+        """ Keeps the previous positions of the unchanged files and places the new or changed
+        files at the weighted average position of their closest coupled files.
+        Returns None if a full layout is needed, either because there is no previous layout
+        or because the drift since the last full layout exceeds drift_threshold.
+        """
+
+        logger = logging.getLogger('viseagull')
+
+        commits = self.files_commits(df.index)
+        fixed = [i for i, file_name in enumerate(df.index)
+                if file_name in self.previous_positions and self.previous_commits.get(file_name) == commits[file_name]]
+        removed = len(set(self.previous_positions) - set(df.index))
+
+        if len(fixed) == 0:
+            return None
+
+        drift = self.previous_drift + (len(df) - len(fixed) + removed) / len(df)
+        if drift > self.drift_threshold:
+            logger.info(f'Layout drift {drift:.2f} above {self.drift_threshold}, computing a full layout')
+            return None
+
+        distances = df.to_numpy()
+        positions = zeros((len(df), 2))
+        fixed_set = set(fixed)
+
+        for i, file_name in enumerate(df.index):
+            if i in fixed_set:
+                positions[i] = self.previous_positions[file_name]
+            else:
+                neighbours_distances = distances[i, fixed]
+                closest = neighbours_distances.argsort()[:n_neighbors]
+                # Coupled neighbours only, unless the file is not coupled to any placed file
+                coupled = [j for j in closest if neighbours_distances[j] < 1]
+                if len(coupled) == 0:
+                    coupled = closest[:1]
+                weights = asarray([1 / (neighbours_distances[j] + 1e-3) for j in coupled])
+                neighbours_positions = asarray([self.previous_positions[df.index[fixed[j]]] for j in coupled])
+                positions[i] = weights @ neighbours_positions / weights.sum()
+
+        logger.info(f'Placed {len(df) - len(fixed)} files incrementally, layout drift {drift:.2f}')
+        self.previous_drift = drift
+
+        return DataFrame(positions, index=df.index)
+
+    def files_commits(self, files):
+        """ Number of commits modifying each file, used to detect files whose couplings changed.
+        """
+
+        commits = self.analyzer.df.drop(columns=['sum'], errors='ignore').sum(axis=1)
+
+        return {file_name:int(commits.get(file_name, 0)) for file_name in files}
+
+    def initial_positions(self, df):
+        """ Builds a tSNE initialization from the coordinates saved by the previous run.
+        Files without a saved position start next to their closest positioned file.
+        Returns 'random' if no previous layout is available.
+        """
+
+        positioned = [i for i, file_name in enumerate(df.index) if file_name in self.previous_positions]
+        if len(positioned) == 0:
+            return 'random'
+
+        rng = random.RandomState(0)
+        distances = df.to_numpy()
+        init = zeros((len(df), 2))
+
+        for i, file_name in enumerate(df.index):
+            if file_name in self.previous_positions:
+                init[i] = self.previous_positions[file_name]
+            else:
+                closest = positioned[int(distances[i, positioned].argmin())]
+                init[i] = asarray(self.previous_positions[df.index[closest]]) + rng.normal(scale=1e-2, size=2)
+
+        # Same scale as sklearn's PCA initialization
+        init = init - init.mean(axis=0)
+        std = init[:, 0].std()
+        if std > 0:
+            init = init / std * 1e-4
+
+        return init
+
+    def layout_path(self):
+
+        repo_id = self.analyzer._get_repo_id_from_url(self.analyzer.url)
+        couplings_type = self.analyzer.couplings_type if self.view is None else f'{self.analyzer.couplings_type}-{self.view}'
+        return path.join(LAYOUTS_FOLDER, f'layout_{couplings_type}_{repo_id}'
+                f'{self.analyzer.get_nodes_suffix()}{self.analyzer.get_window_suffix()}.json')
+
+    def load_layout(self):
+        """ Loads the files positions saved by the previous run on the same repository.
+        """
+
+        layout_path = self.layout_path()
+        if not path.exists(layout_path):
+            return
+
+        with open(layout_path, encoding="utf-8") as f:
+            layout = json.load(f)
+
+        self.previous_positions = {file_name:tuple(position) for file_name, position in layout['files'].items()}
+        self.previous_commits = layout.get('commits', {})
+        self.previous_drift = layout.get('drift', 0)
+
+    def save_layout(self, df_reduced, drift=0):
+        """ Saves the files positions so the next run can start from them.
+        """
+
+        positions = df_reduced.iloc[:, :2].to_numpy().tolist()
+
+        layout = {
+            'layout': self.layout,
+            'files': {file_name:[float(x), float(y)] for file_name, (x, y) in zip(df_reduced.index, positions)},
+            'commits': self.files_commits(df_reduced.index),
+            'drift': drift
+            }
+
+        makedirs(LAYOUTS_FOLDER, exist_ok=True)
+        with open(self.layout_path(), "w", encoding="utf-8") as f:
+            json.dump(layout, f)
+
+    @profiled('routes')
     def find_routes(self, clusters, df):
         """ Find the routes between clusters for a Software as Cities visualization.
         """
@@ -120,10 +459,11 @@ class DataProcessor:
 
         return cluster_centroid
 
-    def create_js_file(self, save_data=False):
+    @staticmethod
+    def cities_template(name, cities_data):
 
-        template = """const citiesData = ["""
-        for city in self.citiesData:
+        template = f"const {name} = ["
+        for city in cities_data:
             template += '{ centroid : {x :' + str(city['centroid']['x']) +', y :' + str(str(city['centroid']['y'])) + '},'
             template += 'buildings : ['
             for building in city['buildings']:
@@ -133,6 +473,15 @@ class DataProcessor:
             template += 'cityLabel : ' + str(city['label']) + '},'
         template += '];\n'
 
+        return template
+
+    @profiled('JS write')
+    def create_js_file(self, save_data=False, write_visualization=True):
+
+        template = self.cities_template('citiesData', self.citiesData)
+        for view, cities_data in self.views_cities_data.items():
+            template += self.cities_template(f'{view}CitiesData', cities_data)
+
         template += "const routesData = ["
         for route, routeWidth in self.cluster_to_route.items():
             template += '{ route : {start :' + str(route[0]) + ', end :' + str(route[1]) + '}, width : ' + str(routeWidth) + '},'
@@ -169,19 +518,33 @@ class DataProcessor:
         template += ';\n'
 
 
+        template += "const timeline = "
+        template += json.dumps(self.timeline, separators=(',', ':'))
+        template += ';\n'
+
         template += """\n"""
-        template += "export { citiesData, routesData, commitToFiles, filesModificationsDates, url, commitsHashes, activeBranch };"
+        views_exports = ''.join(f'{view}CitiesData, ' for view in self.views_cities_data)
+        template += "export { citiesData, " + views_exports + "routesData, commitToFiles, filesModificationsDates, url, commitsHashes, activeBranch, timeline };"
 
-        with open("./visualization/data.js", "w", encoding="utf-8") as f:
-            f.write(template)
+        if write_visualization:
+            # Written aside and moved in place, the web server may be sending data.js to a browser
+            tmp_path = f'./visualization/data.js.{getpid()}.tmp'
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(template)
+            replace(tmp_path, "./visualization/data.js")
 
         if save_data:
-            file_name = f'data_{self.analyzer.couplings_type}_{self.analyzer._get_repo_name_from_url(self.analyzer.url)}.js'
-            with open("./saved_templates/" + file_name, "w", encoding="utf-8") as f:
-                f.write(template)
+            repo_name = self.analyzer._get_repo_name_from_url(self.analyzer.url)
+            repo_id = self.analyzer._get_repo_id_from_url(self.analyzer.url)
+            file_name = (f'data_{self.analyzer.couplings_type}_{repo_id}{self.analyzer.get_nodes_suffix()}'
+                    f'{self.analyzer.get_window_suffix()}{self.analyzer.template_suffix}.js')
+            entry = TemplateStore().save(file_name, template, repo_name, self.analyzer.couplings_type, self.analyzer.head)
+            self.template_name = file_name
             
             logger = logging.getLogger('viseagull')
-            logger.info(f"Saved template as {file_name} in ./saved_templates folder")
+            logger.info(f"Saved template as {file_name} in ./saved_templates folder "
+                    f"({TemplateStore.format_size(entry['compressed_size'])} compressed from "
+                    f"{TemplateStore.format_size(entry['size'])})")
 
 
         return template
\ No newline at end of file
@@ -0,0 +1,160 @@
+import gzip
+import json
+
+from contextlib import contextmanager
+from datetime import datetime
+from hashlib import sha256
+from os import path, makedirs, replace, remove, listdir, getpid, open as os_open, close, O_CREAT, O_EXCL
+from time import time, sleep
+
+TEMPLATES_FOLDER = './saved_templates/'
+
+class TemplateStore:
+
+    LOCK_TIMEOUT = 10
+
+    def __init__(self, folder=TEMPLATES_FOLDER) -> None:
+        """ Stores the saved templates gzip compressed, in folder/objects/ under the hash of their
+        content, so identical templates are stored once. folder/index.json maps the name of each
+        template to its payload and metadata (repo, couplings type, HEAD, creation time, size),
+        so templates are listed without reading the payloads.
+        Templates saved as plain .js files by earlier versions can still be loaded by name.
+
+        Attributes :
+            folder : root folder of the store
+            index_path : path of the index
+        """
+
+        self.folder = folder
+        self.index_path = path.join(folder, 'index.json')
+
+    def load_index(self):
+
+        if not path.exists(self.index_path):
+            return {}
+
+        with open(self.index_path, encoding='utf-8') as f:
+            return json.load(f)['templates']
+
+    def _save_index(self, templates):
+
+        tmp_path = f'{self.index_path}.{getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'templates': templates}, f, indent=4)
+        replace(tmp_path, self.index_path)
+
+    @contextmanager
+    def _lock(self):
+        """ Serializes the updates of the index between processes, e.g. the workers of --batch.
+        A lock older than LOCK_TIMEOUT is left by a crashed process and is broken.
+        """
+
+        lock_path = self.index_path + '.lock'
+        start_time = time()
+        while True:
+            try:
+                close(os_open(lock_path, O_CREAT | O_EXCL))
+                break
+            except FileExistsError:
+                if time() - start_time > self.LOCK_TIMEOUT:
+                    remove(lock_path)
+                    start_time = time()
+                sleep(0.05)
+
+        try:
+            yield
+        finally:
+            remove(lock_path)
+
+    def save(self, name, template, repo=None, couplings_type=None, head=None):
+        """ Saves a template under name, replacing the previous template of the same name.
+        Returns the entry of the template in the index.
+        """
+
+        data = template.encode('utf-8')
+        digest = sha256(data).hexdigest()
+        object_path = path.join('objects', f'{digest}.js.gz')
+
+        makedirs(path.join(self.folder, 'objects'), exist_ok=True)
+        if not path.exists(path.join(self.folder, object_path)):
+            tmp_path = path.join(self.folder, f'{object_path}.{getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                # mtime=0 so the same template always gives the same file
+                with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gzip_file:
+                    gzip_file.write(data)
+            replace(tmp_path, path.join(self.folder, object_path))
+
+        entry = {
+            'name': name,
+            'repo': repo,
+            'couplings_type': couplings_type,
+            'head': head,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'size': len(data),
+            'compressed_size': path.getsize(path.join(self.folder, object_path)),
+            'digest': digest,
+            'path': object_path
+            }
+
+        with self._lock():
+            templates = self.load_index()
+            previous_entry = templates.get(name)
+            templates[name] = entry
+            self._save_index(templates)
+
+            # The payload of the replaced template is removed if no other template uses it
+            if previous_entry is not None and previous_entry['path'] != object_path and \
+                    all(other['path'] != previous_entry['path'] for other in templates.values()):
+                remove(path.join(self.folder, previous_entry['path']))
+
+        return entry
+
+    def list(self):
+        """ Returns the entries of the saved templates, most recent first.
+        Plain templates saved by earlier versions only have a name, size and creation time.
+        """
+
+        templates = self.load_index()
+        entries = list(templates.values())
+        if path.isdir(self.folder):
+            for file_name in listdir(self.folder):
+                file_path = path.join(self.folder, file_name)
+                # Templates of the index are loaded first, a plain template of the same name is hidden
+                if file_name.endswith('.js') and file_name not in templates and path.isfile(file_path):
+                    size = path.getsize(file_path)
+                    entries.append({'name': file_name, 'repo': None, 'couplings_type': None, 'head': None,
+                            'created': datetime.fromtimestamp(path.getmtime(file_path)).isoformat(timespec='seconds'),
+                            'size': size, 'compressed_size': size})
+
+        return sorted(entries, key=lambda entry: entry['created'], reverse=True)
+
+    @staticmethod
+    def format_size(size):
+
+        for unit in ['B', 'kB', 'MB']:
+            if size < 1000:
+                return f'{size:.1f}{unit}'
+            size /= 1000
+
+        return f'{size:.1f}GB'
+
+    def get_path(self, name):
+        """ Returns the path of the payload of a template and whether it is gzip compressed,
+        None if there is no template with this name. A template can also be chosen by a prefix
+        of its digest.
+        """
+
+        templates = self.load_index()
+        entry = templates.get(name)
+        if entry is None:
+            matches = [entry for entry in templates.values() if entry['digest'].startswith(name)]
+            entry = matches[0] if len(matches) == 1 else None
+
+        if entry is not None:
+            return path.join(self.folder, entry['path']), True
+
+        # Plain template saved by an earlier version
+        if path.isfile(path.join(self.folder, name)):
+            return path.join(self.folder, name), False
+
+        return None
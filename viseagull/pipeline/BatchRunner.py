@@ -0,0 +1,123 @@
+import json
+import logging
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from viseagull.pipeline.Pipeline import Pipeline
+
+CLONES_FOLDER = './saved_clones/'
+
+
+def read_batch_file(batch_file):
+    """ Reads a file with one repo url or path per line. Empty lines and lines starting with # are ignored.
+    """
+
+    urls = []
+    with open(batch_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in urls:
+                urls.append(line)
+
+    return urls
+
+def run_repository(url, couplings_types, pipeline_parameters):
+    """ Runs the pipeline of each couplings type on a repo, in a worker process.
+    The couplings types run one after the other so that the later ones reuse the clone
+    and the mining checkpoint of the first one.
+    """
+
+    results = []
+    for couplings_type in couplings_types:
+
+        start_time = time.time()
+        try:
+            pipeline = Pipeline(url, couplings_type, **pipeline_parameters)
+            pipeline.run(save_data=True, write_visualization=False)
+            results.append({
+                'url': url,
+                'couplings_type': couplings_type,
+                'status': 'success',
+                'template': pipeline.data_processor.template_name,
+                'seconds': time.time() - start_time
+                })
+        except Exception:
+            results.append({
+                'url': url,
+                'couplings_type': couplings_type,
+                'status': 'failure',
+                'error': traceback.format_exc(),
+                'seconds': time.time() - start_time
+                })
+
+    return results
+
+
+class BatchRunner:
+
+    def __init__(self, urls, couplings_types, jobs=None, pipeline_parameters=None) -> None:
+        """ Runs the pipeline on several repositories with a bounded pool of worker processes.
+        Each repo is saved as one template per couplings type. A failing repo does not stop
+        the others, failures are listed in the report.
+
+        Attributes :
+            urls : list of repo urls or paths
+            couplings_types : list of couplings types to run on each repo
+            jobs : maximum number of worker processes, number of CPUs if None
+            pipeline_parameters : keyword arguments given to each Pipeline, the corpus of the semantic
+                couplings is extracted by a single process per repo as the repos already run in parallel
+            results : list of dicts, one per repo and couplings type
+        """
+
+        self.urls = urls
+        self.couplings_types = couplings_types
+        self.jobs = jobs
+        self.pipeline_parameters = {'clone_cache': CLONES_FOLDER, 'corpus_workers': 1}
+        if pipeline_parameters is not None:
+            self.pipeline_parameters.update(pipeline_parameters)
+        self.results = []
+
+    def run(self):
+
+        logger = logging.getLogger('viseagull')
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+
+            futures = {executor.submit(run_repository, url, self.couplings_types, self.pipeline_parameters): url
+                    for url in self.urls}
+
+            for i, future in enumerate(as_completed(futures)):
+                url = futures[future]
+                try:
+                    results = future.result()
+                except Exception:
+                    # The worker process itself failed
+                    results = [{'url': url, 'couplings_type': couplings_type, 'status': 'failure',
+                            'error': traceback.format_exc(), 'seconds': None}
+                            for couplings_type in self.couplings_types]
+
+                self.results.extend(results)
+                failures = [result for result in results if result['status'] == 'failure']
+                logger.info(f'[{i + 1}/{len(self.urls)}] {url} : '
+                        + ('done' if len(failures) == 0 else f'{len(failures)} failures'))
+
+        return self.results
+
+    def report(self):
+
+        successes = [result for result in self.results if result['status'] == 'success']
+        failures = [result for result in self.results if result['status'] == 'failure']
+
+        return {
+            'repositories': len(self.urls),
+            'successes': len(successes),
+            'failures': len(failures),
+            'results': self.results
+            }
+
+    def save_report(self, report_path):
+
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=4)
@@ -0,0 +1,143 @@
+import json
+import pickle
+
+from hashlib import sha1
+from os import path, makedirs, replace, getpid, listdir
+from shutil import rmtree
+
+from numpy import load, save
+from pandas import DataFrame
+
+CHECKPOINTS_FOLDER = './saved_checkpoints/'
+
+class Checkpointer:
+
+    def __init__(self, folder=CHECKPOINTS_FOLDER) -> None:
+        """ Stores the results of the pipeline stages on disk so that re-runs can skip them.
+        Each checkpoint is stored in folder/stage/key/ where key is a hash of the inputs
+        and parameters of the stage.
+        A checkpoint can belong to groups, listed in folder/stage/key/groups.txt. A group is the
+        same analysis run on successive HEADs of a repo (--watch, nightly runs) : only its last
+        checkpoint of each stage is kept.
+
+        Attributes :
+            folder : root folder of the checkpoints
+        """
+
+        self.folder = folder
+
+    @staticmethod
+    def key(*parts):
+        """ Computes the key of a checkpoint from the inputs and parameters of its stage.
+        """
+
+        return sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def path(self, stage, key):
+
+        return path.join(self.folder, stage, key)
+
+    def exists(self, stage, key):
+
+        return path.exists(path.join(self.path(stage, key), 'objects.pkl'))
+
+    def save(self, stage, key, objects=None, frames=None, group=None):
+        """ Saves a checkpoint. Objects are pickled, dataframes are stored as .npy files
+        so they can be memory mapped when loaded.
+        If group is given, the previous checkpoints of the group in this stage are removed.
+        """
+
+        objects = {} if objects is None else objects
+        frames = {} if frames is None else frames
+
+        checkpoint_path = self.path(stage, key)
+        makedirs(checkpoint_path, exist_ok=True)
+
+        frames_axes = {}
+        for name, frame in frames.items():
+            if frame is None:
+                continue
+            save(path.join(checkpoint_path, f'{name}.npy'), frame.to_numpy())
+            frames_axes[name] = (frame.index.tolist(), frame.columns.tolist())
+
+        # Objects are written last, their presence marks a complete checkpoint
+        tmp_path = path.join(checkpoint_path, f'objects.pkl.{getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'objects': objects, 'frames': frames_axes}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(tmp_path, path.join(checkpoint_path, 'objects.pkl'))
+
+        if group is not None:
+            self._set_last_checkpoint(stage, key, group)
+
+    def _set_last_checkpoint(self, stage, key, group):
+
+        self._add_group(self.path(stage, key), group)
+        self._evict(stage, key, group)
+
+    @staticmethod
+    def _read_groups(checkpoint_path):
+
+        groups_path = path.join(checkpoint_path, 'groups.txt')
+        if not path.exists(groups_path):
+            return []
+
+        with open(groups_path, encoding='utf-8') as f:
+            return f.read().split()
+
+    @staticmethod
+    def _write_groups(checkpoint_path, groups):
+
+        tmp_path = path.join(checkpoint_path, f'groups.txt.{getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(groups))
+        replace(tmp_path, path.join(checkpoint_path, 'groups.txt'))
+
+    def _add_group(self, checkpoint_path, group):
+
+        groups = self._read_groups(checkpoint_path)
+        if group not in groups:
+            self._write_groups(checkpoint_path, groups + [group])
+
+    def _evict(self, stage, key, group):
+        """ Removes group from the other checkpoints of the stage, and removes the checkpoints
+        left without any group. Checkpoints saved without a group are kept.
+        """
+
+        stage_path = path.join(self.folder, stage)
+        for other_key in listdir(stage_path):
+
+            checkpoint_path = path.join(stage_path, other_key)
+            groups = self._read_groups(checkpoint_path)
+            if other_key == key or group not in groups:
+                continue
+
+            groups.remove(group)
+            if len(groups) > 0:
+                self._write_groups(checkpoint_path, groups)
+            else:
+                # Frames still memory mapped by this process stay readable on POSIX systems
+                rmtree(checkpoint_path, ignore_errors=True)
+
+    def load(self, stage, key, group=None):
+        """ Loads a checkpoint, returns None if it does not exist.
+        Dataframes are memory mapped in copy-on-write mode, so they are not read until used
+        and can still be modified in memory.
+        If group is given, the checkpoint becomes the last checkpoint of the group in this stage.
+        """
+
+        if not self.exists(stage, key):
+            return None
+
+        if group is not None:
+            self._set_last_checkpoint(stage, key, group)
+
+        checkpoint_path = self.path(stage, key)
+        with open(path.join(checkpoint_path, 'objects.pkl'), 'rb') as f:
+            checkpoint = pickle.load(f)
+
+        data = dict(checkpoint['objects'])
+        for name, (index, columns) in checkpoint['frames'].items():
+            values = load(path.join(checkpoint_path, f'{name}.npy'), mmap_mode='c')
+            data[name] = DataFrame(values, index=index, columns=columns, copy=False)
+
+        return data
@@ -0,0 +1,455 @@
+import logging
+import json
+import time
+
+from os import path, makedirs
+
+from numpy import load, save
+from pandas import DataFrame
+
+from viseagull.profiler import get_profiler
+from viseagull.pipeline.Checkpointer import Checkpointer
+from viseagull.pipeline.TimePredictor import TimePredictor
+
+from viseagull.data_processing.DataProcessor import DataProcessor, LAYOUTS_FOLDER
+
+
+class EmptyHistoryError(ValueError):
+    """ Raised when no commit of the repo is left to analyze by the window and the filters of the history.
+    """
+
+
+class Pipeline:
+
+    def __init__(self, url, couplings_type='logical', remove_bulk=-1, layout='tSNE',
+            incremental_layout=False, drift_threshold=0.2, use_checkpoints=True, clone_cache=None,
+            since=None, until=None, last_n_commits=None, commit_filter=None, directory_depth=None,
+            incremental_clustering=False, clustering_tolerance=0.05, max_changed_fraction=0.3, hybrid_weight=0.5,
+            corpus_workers=None) -> None:
+        """ Runs the five steps of the analysis. When use_checkpoints is True, the result of each
+        step is stored on disk, keyed by its inputs and parameters, and re-runs only recompute
+        the steps whose inputs changed.
+
+        Attributes :
+            url : url of the repo (either remote or local)
+            couplings_type : 'logical', 'semantic' or 'hybrid'
+            remove_bulk : commits with more files than remove_bulk are ignored (-1 to keep all commits)
+            layout : layout engine used by the DataProcessor
+            incremental_layout : if True, only new and changed files are placed
+            drift_threshold : drift triggering a full layout in incremental mode
+            clone_cache : folder where remote repos are cloned once and pulled by the next runs
+            mining_parameters : window of the analyzed history (since, until, last_n_commits), applied during mining
+            commit_filter : CommitFilter applied during mining, by default only removes bulk commits
+            directory_depth : if given, files are aggregated to their directory at this depth
+            incremental_clustering : if True, only the files whose couplings changed since the previous run are re-clustered
+            clustering_tolerance : change of distance above which the couplings of a file changed
+            max_changed_fraction : fraction of changed files above which everything is re-clustered
+            hybrid_weight : weight of the logical distance in the hybrid couplings
+            corpus_workers : maximum number of processes extracting the corpus of the semantic couplings,
+                number of CPUs if None
+            checkpointer : Checkpointer object, None if checkpoints are disabled
+            time_predictor : TimePredictor object, predicts and records the execution time of the steps
+            analyzer, clusterer, data_processor : objects of the steps, set by run
+        """
+
+        self.url = url
+        self.couplings_type = couplings_type
+        self.remove_bulk = remove_bulk
+        self.layout = layout
+        self.incremental_layout = incremental_layout
+        self.drift_threshold = drift_threshold
+        self.clone_cache = clone_cache
+        self.mining_parameters = {'since': since, 'until': until, 'last_n_commits': last_n_commits}
+        self.commit_filter = commit_filter
+        self.directory_depth = directory_depth
+        self.incremental_clustering = incremental_clustering
+        self.clustering_tolerance = clustering_tolerance
+        self.max_changed_fraction = max_changed_fraction
+        self.hybrid_weight = hybrid_weight
+        self.corpus_workers = corpus_workers
+
+        self.checkpointer = Checkpointer() if use_checkpoints else None
+        self.time_predictor = TimePredictor(couplings_type)
+
+        self.analyzer = None
+        self.clusterer = None
+        self.data_processor = None
+
+    def get_analyzer(self):
+        
+        # Analyzers are imported on demand so that logical analyses do not load nltk
+        if self.couplings_type == 'logical':
+            from viseagull.analysis.LogicalAnalyzer import LogicalAnalyzer
+            analyzer = LogicalAnalyzer(self.url, self.remove_bulk, mine_history=False, clone_cache=self.clone_cache,
+                    commit_filter=self.commit_filter, directory_depth=self.directory_depth, **self.mining_parameters)
+        elif self.couplings_type == 'semantic':
+            from viseagull.analysis.SemanticAnalyzer import SemanticAnalyzer
+            analyzer = SemanticAnalyzer(self.url, self.remove_bulk, self.corpus_workers, mine_history=False,
+                    clone_cache=self.clone_cache, commit_filter=self.commit_filter, directory_depth=self.directory_depth,
+                    **self.mining_parameters)
+        elif self.couplings_type == 'hybrid':
+            from viseagull.analysis.HybridAnalyzer import HybridAnalyzer
+            analyzer = HybridAnalyzer(self.url, self.remove_bulk, self.hybrid_weight, mine_history=False,
+                    corpus_workers=self.corpus_workers, clone_cache=self.clone_cache, commit_filter=self.commit_filter, directory_depth=self.directory_depth,
+                    **self.mining_parameters)
+        else:
+            raise ValueError("Wrong couplings type")
+
+        return analyzer
+
+    def get_clusterer(self, distance_matrix):
+        
+        if self.couplings_type == 'logical':
+            from viseagull.clustering.LogicalClusterer import LogicalClusterer
+            clusterer = LogicalClusterer(distance_matrix)
+        elif self.couplings_type == 'semantic':
+            from viseagull.clustering.SemanticClusterer import SemanticClusterer
+            clusterer = SemanticClusterer(distance_matrix)
+        elif self.couplings_type == 'hybrid':
+            from viseagull.clustering.HybridClusterer import HybridClusterer
+            clusterer = HybridClusterer(distance_matrix, self.analyzer.views['semantic'], self.hybrid_weight)
+        else:
+            raise ValueError("Wrong couplings type")
+
+        return clusterer
+
+    def checkpoint_group(self, view=None):
+        """ Returns the group of the checkpoints of this analysis : the checkpoints of the same repo and
+        parameters on previous HEADs are removed when new ones are used, e.g. by --watch or nightly runs.
+        """
+
+        return Checkpointer.key('group', self.analyzer._get_repo_id_from_url(self.url),
+                self.analyzer.commit_filter.parameters(), self.mining_parameters, self.couplings_type,
+                self.directory_depth, self.analyzer.commit_filter.focus_directory, self.hybrid_weight, self.layout,
+                self.incremental_layout, self.drift_threshold, self.incremental_clustering, self.clustering_tolerance,
+                self.max_changed_fraction, view)
+
+    def load_checkpoint(self, stage, key, view=None):
+
+        if self.checkpointer is None:
+            return None
+
+        data = self.checkpointer.load(stage, key, self.checkpoint_group(view))
+        if data is not None:
+            logging.getLogger('viseagull').info(f'Loaded {stage} checkpoint')
+
+        return data
+
+    def save_checkpoint(self, stage, key, objects=None, frames=None, view=None):
+
+        if self.checkpointer is not None:
+            self.checkpointer.save(stage, key, objects, frames, self.checkpoint_group(view))
+
+    def clusters_state_path(self):
+
+        repo_id = self.analyzer._get_repo_id_from_url(self.url)
+        return path.join(LAYOUTS_FOLDER, f'clusters_{self.couplings_type}_{repo_id}'
+                f'{self.analyzer.get_nodes_suffix()}{self.analyzer.get_window_suffix()}')
+
+    def load_clusters_state(self):
+        """ Loads the labels and distance matrix of the previous clustering of the repo, None if there is none.
+        """
+
+        state_path = self.clusters_state_path()
+        if not path.exists(state_path + '.json'):
+            return None
+
+        with open(state_path + '.json', encoding='utf-8') as f:
+            state = json.load(f)
+        distance_matrix = DataFrame(load(state_path + '.npy', mmap_mode='r'), index=state['files'],
+                columns=state['files'], copy=False)
+
+        return dict(zip(state['files'], state['labels'])), distance_matrix
+
+    def save_clusters_state(self):
+        """ Saves the labels and distance matrix of the clustering, used by the next incremental clustering.
+        """
+
+        state_path = self.clusters_state_path()
+        makedirs(LAYOUTS_FOLDER, exist_ok=True)
+
+        save(state_path + '.npy', self.clusterer.distance_matrix.to_numpy())
+        with open(state_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'files': self.clusterer.distance_matrix.index.tolist(),
+                'labels': [int(label) for label in self.clusterer.clusters_labels]
+                }, f)
+
+    def cluster(self):
+        """ Computes the clustering, incrementally from the previous run if incremental_clustering is True.
+        """
+
+        previous_state = self.load_clusters_state() if self.incremental_clustering else None
+
+        if previous_state is not None:
+            previous_labels, previous_distance_matrix = previous_state
+            self.clusterer.compute_incremental_clustering(previous_labels, previous_distance_matrix,
+                    self.clustering_tolerance, self.max_changed_fraction)
+        else:
+            self.clusterer.compute_clustering()
+
+    def repository_size(self):
+        """ Returns the number of files, number of commits and average number of files per commit of the repo.
+        """
+
+        number_files = self.analyzer.number_files
+        number_commits = self.analyzer.total_commits
+        average_files_per_commit = 0
+        if len(self.analyzer.commits) > 0:
+            average_files_per_commit = (sum(commit.number_modified_files for commit in self.analyzer.commits) /
+                    len(self.analyzer.commits))
+
+        return number_files, number_commits, average_files_per_commit
+
+    def start_step(self, step, description):
+
+        logger = logging.getLogger('viseagull')
+        logger.info(f'STEP {step}/5 - {description}')
+        get_profiler().start(f'STEP {step}/5 - {description}')
+
+        predicted_execution_time = self.time_predictor.predict(step, *self.repository_size())
+        if predicted_execution_time is not None:
+            logger.debug(f'Predicted execution time : {predicted_execution_time}s')
+
+        return time.time()
+
+    def end_step(self, step, start_time, computed):
+        """ Logs the execution time of a step, and records it if the step was not loaded from a checkpoint.
+        """
+
+        execution_time = time.time() - start_time
+        logging.getLogger('viseagull').debug(f'STEP {step}/5 Executed in {execution_time}s\n')
+
+        if step == 2 and execution_time > 0:
+            get_profiler().count('files/s', self.analyzer.number_files / execution_time)
+        get_profiler().stop()
+
+        if computed:
+            self.time_predictor.record(step, *self.repository_size(), execution_time)
+
+    def history_key(self):
+
+        return Checkpointer.key('history', self.analyzer._get_repo_name_from_url(self.url), self.analyzer.head,
+                self.analyzer.commit_filter.parameters(), self.mining_parameters)
+
+    def couplings_key(self, history_key):
+
+        return Checkpointer.key('couplings', history_key, self.couplings_type, self.directory_depth,
+                self.analyzer.commit_filter.focus_directory)
+
+    def compute_couplings(self):
+        """ Runs the steps 1 and 2 : mining of the history and couplings analysis.
+        Returns the checkpoint key of the couplings.
+        """
+
+        logger = logging.getLogger('viseagull')
+
+        logger.info('STEP 1/5 - Initializing analyzer')
+        get_profiler().start('STEP 1/5 - Initializing analyzer')
+        analyzer = self.get_analyzer()
+        self.analyzer = analyzer
+
+        history_key = self.history_key()
+        couplings_key = self.couplings_key(history_key)
+
+        # The corpus of the semantic couplings is extracted while the history is mined
+        if hasattr(analyzer, 'start_corpus_extraction') and \
+                (self.checkpointer is None or not self.checkpointer.exists('couplings', couplings_key)):
+            analyzer.start_corpus_extraction()
+
+        try:
+            history = self.load_checkpoint('history', history_key)
+            if history is not None:
+                analyzer.set_history(history)
+            else:
+                predicted_execution_time = self.time_predictor.predict(1, *self.repository_size())
+                if predicted_execution_time is not None:
+                    logger.debug(f'Predicted execution time : {predicted_execution_time}s')
+                analyzer.mine_history()
+                self.time_predictor.record(1, *self.repository_size(), analyzer.init_time)
+                self.save_checkpoint('history', history_key, analyzer.get_history())
+
+            get_profiler().count('files', analyzer.number_files)
+            get_profiler().count('commits', len(analyzer.commits))
+            get_profiler().stop()
+
+            if len(analyzer.commits) == 0:
+                raise EmptyHistoryError("No commit to analyze, check --since, --until, --last-n-commits and the commit filters.")
+        except BaseException:
+            # The worker processes of the corpus extraction would otherwise outlive the run
+            if hasattr(analyzer, 'cancel_corpus_extraction'):
+                analyzer.cancel_corpus_extraction()
+            raise
+
+        self.time_predictor.calibrate(analyzer.number_files, analyzer.total_commits, analyzer.init_time)
+
+        start_time = self.start_step(2, 'Analyzing Couplings')
+        couplings = self.load_checkpoint('couplings', couplings_key)
+        if couplings is not None:
+            analyzer.set_couplings_data(couplings)
+        else:
+            analyzer.compute_couplings()
+            self.save_checkpoint('couplings', couplings_key, *analyzer.get_couplings_data())
+        self.end_step(2, start_time, couplings is None)
+
+        return couplings_key
+
+    def run(self, save_data=False, write_visualization=True):
+        """ Runs the analysis and creates the visualization data.
+        If write_visualization is False, ./visualization/data.js is left untouched.
+        """
+
+        couplings_key = self.compute_couplings()
+        self.visualize(couplings_key, save_data, write_visualization)
+
+    def visualize(self, couplings_key, save_data=False, write_visualization=True):
+        """ Runs the steps 3 to 5 from the couplings of the analyzer : distance matrix,
+        clustering and visualization data.
+        """
+
+        logger = logging.getLogger('viseagull')
+        analyzer = self.analyzer
+
+        start_time = self.start_step(3, 'Computing distance matrix')
+        distance_parameters = [self.hybrid_weight] if self.couplings_type == 'hybrid' else []
+        distance_key = Checkpointer.key('distance', couplings_key, *distance_parameters)
+        distance = self.load_checkpoint('distance', distance_key)
+        if distance is not None:
+            analyzer.set_distance_data(distance)
+        else:
+            analyzer.get_distance_matrix()
+            self.save_checkpoint('distance', distance_key, frames=analyzer.get_distance_data())
+        self.end_step(3, start_time, distance is None)
+
+        start_time = self.start_step(4, 'Computing Clustering')
+        clusterer = self.get_clusterer(analyzer.distance_matrix)
+        self.clusterer = clusterer
+        clusters_key = Checkpointer.key('clusters', distance_key, type(clusterer).__name__, self.incremental_clustering,
+                self.clustering_tolerance, self.max_changed_fraction)
+        clusters = self.load_checkpoint('clusters', clusters_key)
+        if clusters is not None:
+            clusterer.clusters = clusters['clusters']
+            clusterer.clusters_labels = clusters['clusters_labels']
+        else:
+            self.cluster()
+            self.save_checkpoint('clusters', clusters_key,
+                    {'clusters': clusterer.clusters, 'clusters_labels': clusterer.clusters_labels})
+        if self.incremental_clustering:
+            self.save_clusters_state()
+        self.end_step(4, start_time, clusters is None)
+
+        start_time = self.start_step(5, 'Setting up visualization data')
+        # Hybrid couplings have one layout per view, the first one is the main layout of the payload
+        views = list(analyzer.views) if self.couplings_type == 'hybrid' else [None]
+        data_processors = []
+        computed = False
+        for view in views:
+            view_processor = DataProcessor(analyzer, clusterer, self.layout, self.incremental_layout,
+                    self.drift_threshold, view)
+            computed = self.compute_embedding(view_processor, clusters_key) or computed
+            data_processors.append(view_processor)
+        data_processor = data_processors[0]
+        self.data_processor = data_processor
+        for view_processor in data_processors[1:]:
+            data_processor.views_cities_data[view_processor.view] = view_processor.get_cities_data()
+        data_processor.setup_visualization_data(save_data, write_visualization)
+        self.end_step(5, start_time, computed)
+
+        for step, report in self.time_predictor.error_report().items():
+            if report['runs'] > 0:
+                logger.debug(f"STEP {step}/5 mean prediction error over {report['runs']} runs : "
+                        f"{100 * report['mean_relative_error']:.0f}%")
+
+    def compute_embedding(self, data_processor, clusters_key):
+        """ Computes the layout of a DataProcessor, or loads it from its checkpoint.
+        Returns True if the layout was computed.
+        """
+
+        embedding_key = Checkpointer.key('embedding', clusters_key, self.layout, self.incremental_layout,
+                self.drift_threshold, data_processor.view)
+        embedding = self.load_checkpoint('embedding', embedding_key, data_processor.view)
+        if embedding is not None:
+            data_processor.df_reduced = embedding['df_reduced']
+            data_processor.centroids_labels = embedding['centroids_labels']
+            return False
+
+        data_processor.compute_layout()
+        self.save_checkpoint('embedding', embedding_key, {'centroids_labels': data_processor.centroids_labels},
+                {'df_reduced': data_processor.df_reduced}, data_processor.view)
+
+        return True
+
+    def update(self, save_data=False):
+        """ Fetches the repo and applies its new commits to the analysis : only the new commits
+        are mined, and their columns appended to the couplings. The couplings are computed again
+        when commits leave the analyzed window, files are renamed or deleted, or the history was
+        rewritten. The distance matrix, clustering and visualization data are then updated.
+        Returns a dict describing the update, None if there are no new commits.
+        """
+
+        logger = logging.getLogger('viseagull')
+        analyzer = self.analyzer
+
+        previous_files = analyzer.repo_files_set
+        previous_renames = len(analyzer.old_to_new_path)
+
+        new_hashes = analyzer.fetch_new_commits()
+        if new_hashes is not None and len(new_hashes) == 0:
+            return None
+
+        if new_hashes is None:
+            logger.info('History rewritten, analyzing the repository again')
+            self.run(save_data)
+            return {'head': analyzer.head, 'commits': None, 'files': None}
+
+        logger.info(f'{len(new_hashes)} new commits')
+        get_profiler().start('Mining new commits')
+        new_commits, removed_hashes = analyzer.mine_new_commits(new_hashes)
+        get_profiler().stop()
+        history_key = self.history_key()
+        self.save_checkpoint('history', history_key, analyzer.get_history())
+
+        start_time = self.start_step(2, 'Analyzing Couplings')
+        incremental = (len(removed_hashes) == 0 and previous_files <= analyzer.repo_files_set and
+                len(analyzer.old_to_new_path) == previous_renames)
+        analyzer.update_couplings(new_commits if incremental else None)
+        couplings_key = self.couplings_key(history_key)
+        self.save_checkpoint('couplings', couplings_key, *analyzer.get_couplings_data())
+        self.end_step(2, start_time, False)
+
+        self.visualize(couplings_key, save_data)
+
+        modified_files = set()
+        for commit in new_commits:
+            modified_files.update(analyzer.commit_to_files.get(commit.hash, []))
+
+        return {'head': analyzer.head, 'commits': len(new_commits), 'files': sorted(modified_files)}
+
+    def run_sliding_window(self, window, step, save_data=True):
+        """ Creates one visualization per window of the history, the co-change counts being
+        updated incrementally from one window to the next. The last window is written to
+        ./visualization/data.js.
+        """
+
+        from viseagull.analysis.SlidingWindow import SlidingWindow
+
+        if self.couplings_type != 'logical':
+            raise ValueError("Sliding windows are only available for logical couplings")
+
+        logger = logging.getLogger('viseagull')
+
+        self.compute_couplings()
+        sliding_window = SlidingWindow(self.analyzer, window, step)
+
+        for start, end, columns in sliding_window.windows():
+
+            if not sliding_window.apply(start, end, columns):
+                logger.info(f'Window {start:%Y-%m-%d} - {end:%Y-%m-%d} skipped, not enough modified files')
+                continue
+
+            logger.info(f'Window {start:%Y-%m-%d} - {end:%Y-%m-%d} : {len(columns)} commits')
+            self.clusterer = self.get_clusterer(self.analyzer.distance_matrix)
+            self.clusterer.compute_clustering()
+            self.data_processor = DataProcessor(self.analyzer, self.clusterer, self.layout, self.incremental_layout,
+                    self.drift_threshold)
+            self.data_processor.setup_visualization_data(save_data)
@@ -0,0 +1,177 @@
+import json
+import logging
+
+from os import path, makedirs
+
+from numpy import asarray, mean
+from scipy.optimize import nnls
+
+TIMINGS_FILE = './saved_timings/timings.jsonl'
+
+# Terms of the regression of the execution time of each step, on the number of files f,
+# the number of commits c and the average number of files per commit a.
+STEPS_FEATURES = {
+    1: lambda f, c, a: [1, c, f * c],
+    2: lambda f, c, a: [1, f, c, f * c, c * a],
+    3: lambda f, c, a: [1, f * c, (f ** 2) * c, f * (c ** 2), f ** 2],
+    4: lambda f, c, a: [1, f, f ** 2, f ** 3],
+    5: lambda f, c, a: [1, f, f * c, (f ** 2) * c, f ** 2],
+}
+
+
+def get_epsilon(number_files, number_commits, init_time):
+
+    time_baseline = number_commits * 3.80640347e-02 + number_files * number_commits * 8.21324738e-06
+    if time_baseline == 0:
+        return 1
+
+    return init_time / time_baseline
+
+def predict_execution_time(number_files, number_commits, epsilon, step):
+    
+    predicted_time = 0
+
+    if step == 2:
+        predicted_time = (number_files * 1.27241508e-04 + number_commits * 1.08355355e-04 +
+            number_files * number_commits * 4.65037380e-07)
+    elif step == 3:
+        predicted_time = (number_files * number_commits * 4.52106394e-07 +
+            (number_files ** 2) * number_commits * 1.32475623e-09 +
+            number_files * (number_commits ** 2) * 1.05041833e-12)
+    elif step == 4:
+        predicted_time = (number_files * 3.33070576e-05 + (number_files ** 3) * 5.49653195e-12)
+    elif step == 5:
+        predicted_time = (number_files * 2.75483947e-03 +
+            number_files * number_commits * 6.98932455e-06 +
+            (number_files ** 2 * number_commits) * 9.12066810e-10)
+    
+
+    if predicted_time < 0:
+        predicted_time = 0
+
+    adjusted_predicted_time = epsilon * predicted_time
+
+    return adjusted_predicted_time
+
+
+class TimePredictor:
+
+    def __init__(self, couplings_type, timings_file=TIMINGS_FILE) -> None:
+        """ Predicts the execution time of the steps of the pipeline. Measured timings are recorded
+        in timings_file and the model of each step is fitted on them once enough runs are recorded.
+        Until then, the default coefficients scaled by the mining time are used.
+
+        Attributes :
+            couplings_type : type of couplings of the run, steps are fitted per couplings type
+            timings_file : JSON lines file with one record per measured step
+            history : list of recorded timings
+            models : dict step -> fitted coefficients
+            epsilon : speed of this machine relative to the default coefficients
+            predictions : dict step -> predicted time of the current run
+        """
+
+        self.couplings_type = couplings_type
+        self.timings_file = timings_file
+        self.history = self.load_history()
+        self.models = self.fit()
+        self.epsilon = 1
+        self.predictions = {}
+
+    def load_history(self):
+
+        if not path.exists(self.timings_file):
+            return []
+
+        history = []
+        with open(self.timings_file, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+
+        return history
+
+    def fit(self):
+        """ Fits the model of each step with a non negative least squares regression on the recorded timings.
+        """
+
+        models = {}
+        for step, features in STEPS_FEATURES.items():
+
+            records = [record for record in self.history
+                    if record['step'] == step and record['couplings_type'] == self.couplings_type]
+            if len(records) <= len(features(0, 0, 0)):
+                continue
+
+            X = asarray([features(record['files'], record['commits'], record['average_files_per_commit'])
+                    for record in records], dtype=float)
+            y = asarray([record['seconds'] for record in records], dtype=float)
+
+            # Scale the columns so the large polynomial terms do not dominate the fit
+            scale = X.max(axis=0)
+            scale[scale == 0] = 1
+            coefficients, _ = nnls(X / scale, y)
+            models[step] = (coefficients / scale).tolist()
+
+        return models
+
+    def calibrate(self, number_files, number_commits, init_time):
+        """ Uses the mining time to scale the default coefficients to this machine.
+        """
+
+        self.epsilon = get_epsilon(number_files, number_commits, init_time)
+
+    def predict(self, step, number_files, number_commits, average_files_per_commit=0):
+
+        if step in self.models:
+            features = STEPS_FEATURES[step](number_files, number_commits, average_files_per_commit)
+            predicted_time = max(0, sum(c * x for c, x in zip(self.models[step], features)))
+        elif step == 1:
+            predicted_time = None
+        else:
+            predicted_time = predict_execution_time(number_files, number_commits, self.epsilon, step)
+
+        self.predictions[step] = predicted_time
+
+        return predicted_time
+
+    def record(self, step, number_files, number_commits, average_files_per_commit, seconds):
+        """ Records the measured time of a step, and logs the error of its prediction.
+        """
+
+        predicted_time = self.predictions.get(step)
+        record = {
+            'step': step,
+            'couplings_type': self.couplings_type,
+            'files': number_files,
+            'commits': number_commits,
+            'average_files_per_commit': average_files_per_commit,
+            'seconds': seconds,
+            'predicted': predicted_time
+            }
+        self.history.append(record)
+
+        makedirs(path.dirname(self.timings_file), exist_ok=True)
+        with open(self.timings_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+        if predicted_time is not None and seconds > 0:
+            error = abs(predicted_time - seconds) / seconds
+            logging.getLogger('viseagull').debug(
+                    f'STEP {step}/5 predicted {predicted_time:.2f}s, measured {seconds:.2f}s, error {100 * error:.0f}%')
+
+    def error_report(self):
+        """ Returns the mean relative error of the recorded predictions of each step.
+        """
+
+        report = {}
+        for step in STEPS_FEATURES.keys():
+            errors = [abs(record['predicted'] - record['seconds']) / record['seconds'] for record in self.history
+                    if record['step'] == step and record['couplings_type'] == self.couplings_type
+                    and record['predicted'] is not None and record['seconds'] > 0]
+            report[step] = {
+                'runs': len(errors),
+                'mean_relative_error': float(mean(errors)) if len(errors) > 0 else None,
+                'fitted': step in self.models
+                }
+
+        return report
@@ -0,0 +1,55 @@
+import logging
+
+from threading import Thread, Event
+
+
+class Watcher:
+
+    def __init__(self, pipeline, interval=60, notifier=None) -> None:
+        """ Polls the repo of a pipeline for new commits, in a background thread,
+        and applies them incrementally with Pipeline.update.
+
+        Attributes :
+            pipeline : Pipeline object, already run once
+            interval : number of seconds between two polls
+            notifier : UpdateNotifier of the web server, told about each update
+            _stopped : Event set to stop the thread
+        """
+
+        self.pipeline = pipeline
+        self.interval = interval
+        self.notifier = notifier
+        self._stopped = Event()
+
+    def poll(self):
+        """ Applies the new commits of the repo, returns the description of the update or None.
+        """
+
+        update = self.pipeline.update()
+        if update is not None and self.notifier is not None:
+            self.notifier.notify(update)
+
+        return update
+
+    def run(self):
+
+        logger = logging.getLogger('viseagull')
+
+        while not self._stopped.wait(self.interval):
+            try:
+                update = self.poll()
+            except Exception:
+                # A failed poll (network error, ...) is retried at the next interval
+                logger.exception('Update of the visualization failed')
+                continue
+
+            if update is not None:
+                logger.info(f"Visualization updated to {update['head'][:7]}")
+
+    def start(self):
+
+        Thread(target=self.run, name='viseagull-watcher', daemon=True).start()
+
+    def stop(self):
+
+        self._stopped.set()
@@ -0,0 +1,198 @@
+import json
+import sys
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+from functools import wraps
+from os import path, makedirs
+
+try:
+    from resource import getrusage, RUSAGE_SELF
+except ImportError:
+    # Not available on Windows, the RSS is then not reported
+    getrusage = None
+
+
+class Profiler:
+
+    def __init__(self, enabled=True) -> None:
+        """ Records the wall time, CPU time and peak memory of nested spans (pipeline steps and their
+        sub-steps) along with counters. A disabled profiler does nothing, so the instrumented code
+        does not need to check whether profiling is active.
+
+        Attributes :
+            enabled : whether spans and counters are recorded
+            spans : list of finished spans, as dicts
+            counters : dict name -> value
+            _stack : spans currently running
+            _origin : wall time at the creation of the profiler
+        """
+
+        self.enabled = enabled
+        self.spans = []
+        self.counters = {}
+        self._stack = []
+        self._origin = time.perf_counter()
+
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self, name):
+
+        if not self.enabled:
+            return
+
+        # Keep track of the peak of the parent span before resetting it for the child
+        if len(self._stack) > 0:
+            parent = self._stack[-1]
+            parent['peak_memory'] = max(parent['peak_memory'], tracemalloc.get_traced_memory()[1])
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        self._stack.append({
+            'name': name,
+            'depth': len(self._stack),
+            'start': time.perf_counter() - self._origin,
+            'cpu_start': time.process_time(),
+            'peak_memory': 0,
+            'counters': {}
+            })
+
+    def stop(self):
+
+        if not self.enabled:
+            return
+
+        span = self._stack.pop()
+        span['wall_time'] = time.perf_counter() - self._origin - span['start']
+        span['cpu_time'] = time.process_time() - span.pop('cpu_start')
+        span['peak_memory'] = max(span['peak_memory'], tracemalloc.get_traced_memory()[1])
+        span['max_rss'] = self.max_rss()
+
+        if len(self._stack) > 0:
+            parent = self._stack[-1]
+            parent['peak_memory'] = max(parent['peak_memory'], span['peak_memory'])
+
+        self.spans.append(span)
+
+    @contextmanager
+    def span(self, name):
+
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def count(self, name, value):
+        """ Records a counter on the running span. value can be a function, only called when profiling,
+        for counters that are costly to compute.
+        """
+
+        if not self.enabled:
+            return
+
+        if callable(value):
+            value = value()
+
+        self.counters[name] = value
+        if len(self._stack) > 0:
+            self._stack[-1]['counters'][name] = value
+
+    @staticmethod
+    def max_rss():
+        """ Returns the peak resident set size of the process in bytes, None if it is not available.
+        """
+
+        if getrusage is None:
+            return None
+
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        max_rss = getrusage(RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return max_rss
+        return max_rss * 1024
+
+    def report(self):
+
+        return {
+            'spans': sorted(self.spans, key=lambda span: span['start']),
+            'counters': self.counters
+            }
+
+    def chrome_trace(self):
+        """ Returns the spans in the Chrome trace event format (chrome://tracing, Perfetto).
+        """
+
+        events = []
+        for span in self.spans:
+            events.append({
+                'name': span['name'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['wall_time'] * 1e6,
+                'pid': 1,
+                'tid': 1,
+                'args': {
+                    'cpu_time': span['cpu_time'],
+                    'peak_memory': span['peak_memory'],
+                    'max_rss': span['max_rss'],
+                    **span['counters']
+                    }
+                })
+            for name, value in span['counters'].items():
+                if isinstance(value, (int, float)):
+                    events.append({
+                        'name': name,
+                        'ph': 'C',
+                        'ts': (span['start'] + span['wall_time']) * 1e6,
+                        'pid': 1,
+                        'args': {name: value}
+                        })
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, folder, name):
+        """ Writes the JSON report and the Chrome trace, returns their paths.
+        """
+
+        makedirs(folder, exist_ok=True)
+        report_path = path.join(folder, f'{name}.json')
+        trace_path = path.join(folder, f'{name}.trace.json')
+
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=4)
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+        return report_path, trace_path
+
+
+_profiler = Profiler(enabled=False)
+
+def get_profiler():
+    """ Returns the active profiler, a disabled one if profiling is off.
+    """
+
+    return _profiler
+
+def set_profiler(profiler):
+
+    global _profiler
+    _profiler = profiler
+
+def profiled(name):
+    """ Decorator recording each call of a function as a span of the active profiler.
+    """
+
+    def decorator(function):
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_profiler().span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
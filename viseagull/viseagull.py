@@ -1,80 +1,14 @@
 import logging
+import json
 from os import remove
-import time
 
 from argparse import ArgumentParser
-from shutil import copy
+from datetime import datetime, timedelta
+from time import time
 
-from numpy import number
-
-from viseagull.webserver import run_webserver
-from viseagull.analysis.LogicalAnalyzer import LogicalAnalyzer
-from viseagull.analysis.SemanticAnalyzer import SemanticAnalyzer
-
-from viseagull.clustering.LogicalClusterer import LogicalClusterer
-from viseagull.clustering.SemanticClusterer import SemanticClusterer
-
-from viseagull.data_processing.DataProcessor import DataProcessor
-
-def get_analyzer(couplings_type, url, remove_bulk):
-    
-    if couplings_type is not None:
-        if couplings_type[0] == 'logical':
-            analyzer = LogicalAnalyzer(url, remove_bulk)
-        elif couplings_type[0] == 'semantic':
-            analyzer = SemanticAnalyzer(url, remove_bulk)
-        else:
-            raise ValueError("Wrong couplings type")
-    else:
-        analyzer = LogicalAnalyzer(url, remove_bulk)
-
-    return analyzer
-
-def get_clusterer(couplings_type, distance_matrix):
-    
-    if couplings_type is not None:
-        if couplings_type[0] == 'logical':
-            clusterer = LogicalClusterer(distance_matrix)
-        elif couplings_type[0] == 'semantic':
-            clusterer = SemanticClusterer(distance_matrix)
-        else:
-            raise ValueError("Wrong couplings type")
-    else:
-        clusterer = LogicalClusterer(distance_matrix)
-
-    return clusterer
-
-def get_epsilon(number_files, number_commits, init_time):
-
-    time_baseline = number_commits * 3.80640347e-02 + number_files * number_commits * 8.21324738e-06
-    
-    return init_time / time_baseline
-
-def predict_execution_time(number_files, number_commits, epsilon, step):
-    
-    predicted_time = 0
-
-    if step == 2:
-        predicted_time = (number_files * 1.27241508e-04 + number_commits * 1.08355355e-04 +
-            number_files * number_commits * 4.65037380e-07)
-    elif step == 3:
-        predicted_time = (number_files * number_commits * 4.52106394e-07 +
-            (number_files ** 2) * number_commits * 1.32475623e-09 +
-            number_files * (number_commits ** 2) * 1.05041833e-12)
-    elif step == 4:
-        predicted_time = (number_files * 3.33070576e-05 + (number_files ** 3) * 5.49653195e-12)
-    elif step == 5:
-        predicted_time = (number_files * 2.75483947e-03 +
-            number_files * number_commits * 6.98932455e-06 +
-            (number_files ** 2 * number_commits) * 9.12066810e-10)
-    
-
-    if predicted_time < 0:
-        predicted_time = 0
-
-    adjusted_predicted_time = epsilon * predicted_time
-
-    return adjusted_predicted_time
+from viseagull.webserver import run_webserver, UpdateNotifier
+from viseagull.profiler import Profiler, get_profiler, set_profiler
+from viseagull.analysis.CommitFilter import CommitFilter
 
 def main():
 
@@ -91,72 +25,214 @@ under certain conditions;\n\n"""
 
     parser = ArgumentParser(description='Process repository url')
     parser.add_argument('url', type=str, nargs='?')
-    parser.add_argument('--couplings', type=str, nargs=1, help="logical or semantic")
+    parser.add_argument('--couplings', type=str, nargs='+', help="logical, semantic or hybrid (several types with --batch)")
+    parser.add_argument('--hybrid-weight', help="weight of the logical couplings in the hybrid couplings, the semantic "
+            "couplings have 1 - weight (default 0.5)", type=float, nargs=1)
     parser.add_argument('--save', help='save template', action='store_true')
     parser.add_argument('--load', help='load existing template', type=str, nargs=1)
+    parser.add_argument('--list-templates', help='lists the saved templates and exits', action='store_true')
     parser.add_argument('--debug', help='displays running times', action='store_true')
     parser.add_argument('--remove-bulk', help="removes commits with more than N files from analysis", type=int, nargs=1)
+    parser.add_argument('--max-lines', help="removes commits modifying more than N lines from analysis", type=int, nargs=1)
+    parser.add_argument('--skip-merges', help="removes merge commits from analysis", action='store_true')
+    parser.add_argument('--include', help="only analyzes the files matching these glob patterns", type=str, nargs='+')
+    parser.add_argument('--exclude', help="does not analyze the files matching these glob patterns "
+            "(default *.zip *.gif *.png)", type=str, nargs='+')
+    parser.add_argument('--exclude-authors', help="removes commits of these author names or emails from analysis",
+            type=str, nargs='+')
+    parser.add_argument('--directory-depth', help="analyzes the directories at depth N instead of the files (for big repos)",
+            type=int, nargs=1)
+    parser.add_argument('--focus', help="only analyzes the files of this directory", type=str, nargs=1)
+    parser.add_argument('--layout', help="layout engine : tSNE, sparse-tSNE or centroids", type=str, nargs=1,
+            choices=['tSNE', 'sparse-tSNE', 'centroids'])
+    parser.add_argument('--incremental-layout', help="keeps the previous positions and only places new or changed files",
+            action='store_true')
+    parser.add_argument('--layout-drift', help="fraction of incrementally placed files triggering a full layout (default 0.2)",
+            type=float, nargs=1)
+    parser.add_argument('--incremental-clustering', help="only re-clusters the files whose couplings changed since the "
+            "previous run", action='store_true')
+    parser.add_argument('--clustering-tolerance', help="change of distance above which the couplings of a file changed "
+            "(default 0.05)", type=float, nargs=1)
+    parser.add_argument('--max-changed-fraction', help="fraction of changed files above which everything is re-clustered "
+            "(default 0.3)", type=float, nargs=1)
+    parser.add_argument('--no-checkpoints', help="recomputes every step instead of reusing ./saved_checkpoints",
+            action='store_true')
+    parser.add_argument('--profile', help="records time and memory of each step in ./saved_profiles",
+            action='store_true')
+    parser.add_argument('--batch', help="file listing one repository url or path per line, analyzed in parallel",
+            type=str, nargs=1)
+    parser.add_argument('--jobs', help="number of worker processes of --batch (default number of CPUs)", type=int, nargs=1)
+    parser.add_argument('--clone-cache', help="folder where remote repositories are cloned once and pulled by the next runs",
+            type=str, nargs=1)
+    parser.add_argument('--since', help="only analyzes the commits after this date (YYYY-MM-DD)",
+            type=datetime.fromisoformat, nargs=1)
+    parser.add_argument('--until', help="only analyzes the commits before this date (YYYY-MM-DD)",
+            type=datetime.fromisoformat, nargs=1)
+    parser.add_argument('--last-n-commits', help="only analyzes the last N commits", type=int, nargs=1)
+    parser.add_argument('--sliding-window', help="creates one saved template per window of N days (logical couplings)",
+            type=int, nargs=1)
+    parser.add_argument('--window-step', help="number of days between two sliding windows (default the window size)",
+            type=int, nargs=1)
+    parser.add_argument('--watch', help="keeps polling the repository every N seconds (default 60) and pushes "
+            "the new commits to the browser", type=int, nargs='?', const=60)
+    parser.add_argument('--timings-report', help="displays the prediction error of the recorded execution times and exits",
+            action='store_true')
     args = parser.parse_args()
 
     if args.debug:
         logger.setLevel(level=logging.DEBUG)
 
-    if args.url is None and args.load is None:
+    if args.timings_report:
+        from viseagull.pipeline.TimePredictor import TimePredictor
+        couplings_type = 'logical' if args.couplings is None else args.couplings[0]
+        print(json.dumps(TimePredictor(couplings_type).error_report(), indent=4))
+        return
+
+    if args.list_templates:
+        from viseagull.data_processing.TemplateStore import TemplateStore
+        for entry in TemplateStore().list():
+            print(f"{entry['name']}  {entry['couplings_type'] or '-'}  {entry['repo'] or '-'}  HEAD {(entry['head'] or '-')[:7]}  "
+                    f"{entry['created']}  {TemplateStore.format_size(entry['size'])} "
+                    f"({TemplateStore.format_size(entry['compressed_size'])} compressed)")
+        return
+
+    if args.url is None and args.load is None and args.batch is None:
         parser.error("Viseagull requires the url to a repository. See --help for more details.")
 
+    if args.couplings is not None and len(args.couplings) > 1 and args.batch is None:
+        parser.error("Several couplings types can only be used with --batch.")
+
+    if args.watch is not None and (args.load is not None or args.batch is not None or
+            args.sliding_window is not None or args.until is not None):
+        parser.error("--watch cannot be used with --load, --batch, --sliding-window or --until.")
+
+    if args.sliding_window is not None and args.couplings is not None and any(couplings_type != 'logical'
+            for couplings_type in args.couplings):
+        parser.error("--sliding-window is only available for logical couplings.")
+
+    remove_bulk = -1
+    if args.remove_bulk is not None:
+        remove_bulk = args.remove_bulk[0]
+    layout = 'tSNE'
+    if args.layout is not None:
+        layout = args.layout[0]
+    drift_threshold = 0.2
+    if args.layout_drift is not None:
+        drift_threshold = args.layout_drift[0]
+    clone_cache = None
+    if args.clone_cache is not None:
+        clone_cache = args.clone_cache[0]
+    commit_filter = CommitFilter(
+        max_files=remove_bulk,
+        max_lines=-1 if args.max_lines is None else args.max_lines[0],
+        skip_merges=args.skip_merges,
+        include_paths=args.include,
+        exclude_paths=args.exclude,
+        exclude_authors=args.exclude_authors,
+        focus_directory=None if args.focus is None else args.focus[0]
+        )
+    directory_depth = None if args.directory_depth is None else args.directory_depth[0]
+    clustering_parameters = {
+        'incremental_clustering': args.incremental_clustering,
+        'clustering_tolerance': 0.05 if args.clustering_tolerance is None else args.clustering_tolerance[0],
+        'max_changed_fraction': 0.3 if args.max_changed_fraction is None else args.max_changed_fraction[0],
+        'hybrid_weight': 0.5 if args.hybrid_weight is None else args.hybrid_weight[0]
+        }
+    mining_parameters = {
+        'since': None if args.since is None else args.since[0],
+        'until': None if args.until is None else args.until[0],
+        'last_n_commits': None if args.last_n_commits is None else args.last_n_commits[0]
+        }
+
+    if args.batch is not None:
+
+        from viseagull.pipeline.BatchRunner import BatchRunner, read_batch_file
+
+        couplings_types = ['logical'] if args.couplings is None else args.couplings
+        jobs = None if args.jobs is None else args.jobs[0]
+        pipeline_parameters = {
+            'remove_bulk': remove_bulk,
+            'layout': layout,
+            'incremental_layout': args.incremental_layout,
+            'drift_threshold': drift_threshold,
+            'use_checkpoints': not args.no_checkpoints,
+            'commit_filter': commit_filter,
+            'directory_depth': directory_depth,
+            **clustering_parameters,
+            **mining_parameters
+            }
+        if clone_cache is not None:
+            pipeline_parameters['clone_cache'] = clone_cache
+
+        batch_runner = BatchRunner(read_batch_file(args.batch[0]), couplings_types, jobs, pipeline_parameters)
+        batch_runner.run()
+        batch_runner.save_report('./batch_report.json')
+
+        report = batch_runner.report()
+        logger.info(f"Batch done : {report['successes']} successes, {report['failures']} failures, "
+                "see ./batch_report.json")
+        for result in report['results']:
+            if result['status'] == 'failure':
+                logger.info(f"{result['url']} ({result['couplings_type']}) failed :\n{result['error']}")
+        return
+
+    notifier = None
+    template = None
+
     if args.load is not None:
 
+        from viseagull.data_processing.TemplateStore import TemplateStore
+
         logger.info('Loading existing template')
-        src = './saved_templates/' + args.load[0]
-        dest = './visualization/data.js'
-        copy(src, dest)
+        # The template is served from the store, ./visualization/data.js is left untouched
+        template = TemplateStore().get_path(args.load[0])
+        if template is None:
+            parser.error(f"No saved template named {args.load[0]}, see --list-templates.")
 
     else:
 
-        logger.info('STEP 1/5 - Initializing analyzer')
-        remove_bulk = -1
-        if args.remove_bulk is not None:
-            remove_bulk = args.remove_bulk[0]
-        analyzer = get_analyzer(args.couplings, args.url, remove_bulk)
-        
-        number_files = analyzer.number_files
-        number_commits = analyzer.total_commits
-        init_time = analyzer.init_time
-        epsilon = get_epsilon(number_files, number_commits, init_time)
-
-        logger.info('STEP 2/5 - Analyzing Couplings')
-        predicted_execution_time = predict_execution_time(number_files, number_commits, epsilon, 2)
-        logger.debug(f'Predicted execution time : {predicted_execution_time}s')
-        start_time = time.time()
-        analyzer.compute_couplings()
-        logger.debug(f'STEP 2/5 Executed in {time.time() - start_time}s\n')
-
-        logger.info('STEP 3/5 - Computing distance matrix')
-        predicted_execution_time = predict_execution_time(number_files, number_commits, epsilon, 3)
-        logger.debug(f'Predicted execution time : {predicted_execution_time}s')
-        start_time = time.time()
-        distance_matrix = analyzer.get_distance_matrix()
-        logger.debug(f'STEP 3/5 Executed in {time.time() - start_time}s\n')
-
-        logger.info('STEP 4/5 - Computing Clustering')
-        predicted_execution_time = predict_execution_time(number_files, number_commits, epsilon, 4)
-        logger.debug(f'Predicted execution time : {predicted_execution_time}s')
-        start_time = time.time()
-        clusterer = get_clusterer(args.couplings, distance_matrix)
-        clusterer.compute_clustering()
-        logger.debug(f'STEP 4/5 Executed in {time.time() - start_time}s\n')
-
-        logger.info('STEP 5/5 - Setting up visualization data')
-        predicted_execution_time = predict_execution_time(number_files, number_commits, epsilon, 5)
-        logger.debug(f'Predicted execution time : {predicted_execution_time}s')
-        start_time = time.time()
-        data_processor = DataProcessor(analyzer, clusterer)
-        data_processor.setup_visualization_data(args.save)
-        logger.debug(f'STEP 5/5 Executed in {time.time() - start_time}s\n')
+        couplings_type = 'logical'
+        if args.couplings is not None:
+            couplings_type = args.couplings[0]
+
+        # Imported here so that --load does not load the scientific stack
+        from viseagull.pipeline.Pipeline import Pipeline, EmptyHistoryError
+
+        if args.profile:
+            set_profiler(Profiler())
+
+        if args.watch is not None:
+            # Only the files changed by the new commits are placed and clustered again
+            clustering_parameters['incremental_clustering'] = True
+
+        pipeline = Pipeline(args.url, couplings_type, remove_bulk, layout, args.incremental_layout or args.watch is not None,
+                drift_threshold, use_checkpoints=not args.no_checkpoints, clone_cache=clone_cache,
+                commit_filter=commit_filter, directory_depth=directory_depth, **mining_parameters, **clustering_parameters)
+
+        try:
+            if args.sliding_window is not None:
+                window = timedelta(days=args.sliding_window[0])
+                step = window if args.window_step is None else timedelta(days=args.window_step[0])
+                pipeline.run_sliding_window(window, step)
+            else:
+                pipeline.run(args.save)
+        except EmptyHistoryError as error:
+            parser.error(str(error))
+
+        if args.profile:
+            profile_name = f'profile_{couplings_type}_{pipeline.analyzer._get_repo_name_from_url(args.url)}_{int(time())}'
+            report_path, trace_path = get_profiler().save('./saved_profiles', profile_name)
+            logger.info(f'Saved profile as {report_path} and {trace_path}')
+
+        if args.watch is not None:
+            from viseagull.pipeline.Watcher import Watcher
+            notifier = UpdateNotifier()
+            Watcher(pipeline, args.watch, notifier).start()
+            logger.info(f'Watching the repository for new commits every {args.watch}s')
 
     logger.info('Visualization web server running at localhost:8000')
     logger.info('Open localhost:8000 in your browser to view the visualization')
-    run_webserver()
+    run_webserver(notifier, template)
     
 
 if __name__ == "__main__":
@@ -1,26 +1,143 @@
+import json
+import gzip
+
 from http.server import SimpleHTTPRequestHandler
-from socketserver import TCPServer
+from socketserver import ThreadingTCPServer
+from threading import Condition
+
+from functools import partial
+from os import path, getcwd, fstat
+from shutil import copyfileobj
+from urllib.parse import urlsplit
+
+
+class UpdateNotifier:
+
+    def __init__(self) -> None:
+        """ Hands the updates of the visualization from the watcher to the connected browsers.
+
+        Attributes :
+            version : number of updates so far
+            message : description of the last update
+            _condition : Condition the /events requests wait on
+        """
+
+        self.version = 0
+        self.message = None
+        self._condition = Condition()
+
+    def notify(self, message):
+
+        with self._condition:
+            self.version += 1
+            self.message = message
+            self._condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        """ Waits for an update more recent than version.
+        Returns the new version and its message, or version and None after timeout.
+        """
+
+        with self._condition:
+            if self._condition.wait_for(lambda: self.version > version, timeout):
+                return self.version, self.message
+
+        return version, None
+
+
+class VisualizationRequestHandler(SimpleHTTPRequestHandler):
+    """ Serves the visualization folder, and the updates pushed by the notifier of
+    the server as server-sent events on /events. If the server has a template, it is
+    served as /data.js straight from the template store, still compressed if the browser
+    accepts gzip.
+    """
+
+    KEEP_ALIVE_INTERVAL = 15
+
+    def do_GET(self):
+
+        request_path = urlsplit(self.path).path
+        if request_path == '/data.js' and self.server.template is not None:
+            return self.send_template(*self.server.template)
+        if request_path != '/events':
+            return super().do_GET()
+
+        notifier = self.server.notifier
+        if notifier is None:
+            # 204 tells the browser to stop reconnecting
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        version = notifier.version
+        try:
+            while True:
+                version, message = notifier.wait(version, self.KEEP_ALIVE_INTERVAL)
+                if message is None:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    self.wfile.write(f'event: update\ndata: {json.dumps(message)}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_template(self, template_path, compressed):
+
+        send_compressed = compressed and 'gzip' in self.headers.get('Accept-Encoding', '')
+
+        with open(template_path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/javascript')
+            self.send_header('Cache-Control', 'no-cache')
+            if send_compressed:
+                self.send_header('Content-Encoding', 'gzip')
+            if send_compressed or not compressed:
+                self.send_header('Content-Length', str(fstat(f.fileno()).st_size))
+            self.end_headers()
+
+            if compressed and not send_compressed:
+                with gzip.GzipFile(fileobj=f, mode='rb') as gzip_file:
+                    copyfileobj(gzip_file, self.wfile)
+            else:
+                copyfileobj(f, self.wfile)
+
+
+class VisualizationServer(ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, notifier=None, template=None) -> None:
+
+        self.notifier = notifier
+        self.template = template
+        super().__init__(server_address, handler_class)
 
-from os import path, getcwd, chdir
 
-from pathlib import Path
+def run_webserver(notifier=None, template=None):
+    """ Serves the visualization on port 8000. template is the path of a saved template,
+    and whether it is compressed, served instead of ./visualization/data.js.
+    """
 
-def run_webserver():
-    
     PORT = 8000
 
-    file_path = Path(path.dirname(__file__))
     web_dir = path.join(getcwd(), 'visualization')
-    chdir(web_dir)
 
-    Handler = SimpleHTTPRequestHandler
+    Handler = VisualizationRequestHandler
     Handler.extensions_map.update({
         ".js": "application/javascript",
     })
 
-    httpd = TCPServer(("", PORT), Handler)
+    # The folder is given to the handler instead of changing the working directory,
+    # which the watcher keeps writing to
+    httpd = VisualizationServer(("", PORT), partial(Handler, directory=web_dir), notifier, template)
     httpd.serve_forever()
 
 if __name__ == "__main__":
 
-    run_webserver()
\ No newline at end of file
+    run_webserver()
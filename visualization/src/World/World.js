@@ -31,7 +31,7 @@ let loop;
 
 class World {
 
-  constructor(container, citiesData, routesData, commitToFiles, filesModificationsDates, url, commitsHashes, activeBranch) {
+  constructor(container, citiesData, routesData, commitToFiles, filesModificationsDates, url, commitsHashes, activeBranch, timeline) {
 
 
     // Creating system
@@ -145,7 +145,7 @@ class World {
     */
 
     // GUI
-    var gui = new GUI(cities, filesModificationsDates, this.mouseRaycaster, routes, scene, commitsHashes, url);
+    var gui = new GUI(cities, filesModificationsDates, this.mouseRaycaster, routes, scene, commitsHashes, url, timeline, buildingSize);
 
     
   }
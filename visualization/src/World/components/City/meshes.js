@@ -7,6 +7,15 @@ import { getCityGroundDimensions } from './helpers.js'
 const buildingBaseWidth = 10;
 const buildingSpacing = buildingBaseWidth / 5;
 
+function getHeightScale(height, buildingSize) {
+
+    if (buildingSize.maxBuildingSize - buildingSize.minBuildingSize == 0){
+        return 1;
+    }
+
+    return (9 / (buildingSize.maxBuildingSize - buildingSize.minBuildingSize)) * height + (buildingSize.maxBuildingSize - 10 * buildingSize.minBuildingSize) / (buildingSize.maxBuildingSize - buildingSize.minBuildingSize);
+}
+
 function createMeshes(buildingsData, buildingSize) {
 
     const cityGroundDimensions = getCityGroundDimensions(buildingsData.length);
@@ -36,12 +45,7 @@ function createMeshes(buildingsData, buildingSize) {
         var buildingMaterial = createBuildingMaterial('base', null, null, null);
         const building = new Mesh(geometries.building, buildingMaterial.building);
 
-        var heightScale;
-        if (buildingSize.maxBuildingSize - buildingSize.minBuildingSize == 0){
-            heightScale = 1
-        }else {
-            heightScale = (9 / (buildingSize.maxBuildingSize - buildingSize.minBuildingSize)) * buildingsData[i].height + (buildingSize.maxBuildingSize - 10 * buildingSize.minBuildingSize) / (buildingSize.maxBuildingSize - buildingSize.minBuildingSize);
-        }
+        var heightScale = getHeightScale(buildingsData[i].height, buildingSize);
 
         
         // console.log(heightScale)
@@ -72,4 +76,4 @@ function createMeshes(buildingsData, buildingSize) {
     };
 }
 
-export { createMeshes };
\ No newline at end of file
+export { createMeshes, getHeightScale };
\ No newline at end of file
@@ -0,0 +1,89 @@
+const APPEAR = 0;
+const GROW = 1;
+const RENAME = 2;
+
+// State of the buildings at a commit of the history, computed from the timeline
+// precomputed in data.js : the closest keyframe plus the deltas of the following commits.
+class Timeline {
+
+  constructor(timeline) {
+    this.timeline = timeline;
+    this.index = timeline.commits.length - 1;
+    this.heights = new Map();
+    this.names = new Map();
+    this.applyDeltas(0, this.index);
+  }
+
+  // Moves to the commit at index, returns the ids of the buildings whose state changed
+  seek(index) {
+
+    var changed = new Set();
+
+    if (index < this.index || index - this.index > this.timeline.keyframeInterval) {
+
+      for (let buildingId of this.heights.keys()) {
+        changed.add(buildingId);
+      }
+      this.heights.clear();
+      this.names.clear();
+
+      // Keyframes are stored after every keyframeInterval commits
+      var keyframeIndex = Math.floor((index + 1) / this.timeline.keyframeInterval) * this.timeline.keyframeInterval - 1;
+      var keyframe = this.timeline.keyframes[keyframeIndex];
+      if (keyframe === undefined) {
+        keyframeIndex = -1;
+        keyframe = [];
+      }
+      for (let i = 0; i < keyframe.length; i += 3) {
+        this.heights.set(keyframe[i], keyframe[i + 1]);
+        this.names.set(keyframe[i], keyframe[i + 2]);
+        changed.add(keyframe[i]);
+      }
+      this.index = keyframeIndex;
+    }
+
+    for (let buildingId of this.applyDeltas(this.index + 1, index)) {
+      changed.add(buildingId);
+    }
+    this.index = index;
+
+    return changed;
+  }
+
+  applyDeltas(start, end) {
+
+    var changed = [];
+
+    for (let i = start; i <= end; i++) {
+      var events = this.timeline.deltas[i];
+      for (let j = 0; j < events.length; j += 3) {
+        var buildingId = events[j + 1];
+        if (events[j] == APPEAR) {
+          this.heights.set(buildingId, 1);
+          this.names.set(buildingId, events[j + 2]);
+        } else if (events[j] == GROW) {
+          this.heights.set(buildingId, events[j + 2]);
+        } else if (events[j] == RENAME) {
+          this.names.set(buildingId, events[j + 2]);
+        }
+        changed.push(buildingId);
+      }
+    }
+
+    return changed;
+  }
+
+  getHeight(buildingId) {
+    return this.heights.get(buildingId);
+  }
+
+  getName(buildingId) {
+    return this.timeline.names[this.names.get(buildingId)];
+  }
+
+  getCommit() {
+    return this.index >= 0 ? this.timeline.commits[this.index] : null;
+  }
+}
+
+export { Timeline };
@@ -1,11 +1,13 @@
 import * as dat from 'https://unpkg.com/dat.gui@0.7.7/build/dat.gui.module.js';
 import { getMinMaxDate } from '../helpers/worldHelpers.js';
+import { Timeline } from '../helpers/timeline.js';
+import { getHeightScale } from '../components/City/meshes.js';
 
 
 class GUI {
 
 
-    constructor(cities, filesModificationsDates, mouseRaycaster, routes, scene, commitsHashes, url){
+    constructor(cities, filesModificationsDates, mouseRaycaster, routes, scene, commitsHashes, url, timeline, buildingSize){
 
         this.routes = routes;
 
@@ -62,6 +64,11 @@ class GUI {
             updateDisplayedRoutes(value, routes, scene, mouseRaycaster);
         });
 
+        // Templates saved by earlier versions have no timeline
+        if (timeline !== undefined && timeline.commits.length > 0) {
+            this.addHistoryPlayback(timeline, cities, buildingSize, mouseRaycaster);
+        }
+
         this.gui.add(buttonFeedback,'Send Feedback');
 
         this.gui.width = 700;
@@ -71,9 +78,54 @@ class GUI {
 
     };
 
+    addHistoryPlayback(timelineData, cities, buildingSize, mouseRaycaster){
+
+        var timeline = new Timeline(timelineData);
+
+        // The first names of the timeline are the current names of the buildings
+        var nameToBuilding = new Map();
+        for (let i=0; i<cities.length; i++){
+            for (let j=0; j<cities[i].meshes.buildings.length; j++){
+                nameToBuilding.set(cities[i].meshes.buildings[j].fileName, cities[i].meshes.buildings[j]);
+            }
+        }
+        var buildings = [];
+        for (let i=0; i<timelineData.buildings; i++){
+            buildings.push(nameToBuilding.get(timelineData.names[i]));
+        }
+
+        var parameters = {"History (commit)" : timelineData.commits.length - 1};
+        this.historySlider = this.commitFolder.add(parameters, "History (commit)", 0, timelineData.commits.length - 1, 1);
+        this.historySlider.onChange(function(value){
+            // Only the buildings changed by the deltas between the two commits are updated
+            for (let buildingId of timeline.seek(value)){
+                updateBuilding(buildings[buildingId], timeline.getHeight(buildingId), timeline.getName(buildingId), buildingSize);
+            }
+            mouseRaycaster.updateHighlightedCommit(timeline.getCommit());
+        });
+    }
     
 }
 
+function updateBuilding(building, height, name, buildingSize){
+
+    if (building === undefined){
+        return;
+    }
+
+    if (height === undefined){
+        building.visible = false;
+        return;
+    }
+
+    var heightScale = getHeightScale(height, buildingSize);
+    building.visible = true;
+    building.scale.set(1, heightScale, 1);
+    building.position.y = 10 * heightScale / 2;
+    // fileName stays the current path, used to highlight the commits and open the file
+    building.historicalName = name;
+}
+
 function updateBuildingColor(value, cities, filesModificationsDates){
 
     var minMaxDate = null;
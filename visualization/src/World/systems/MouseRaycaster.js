@@ -110,7 +110,9 @@ const setSize = (container, camera, renderer) => {
                         this.trackedObjects[i].object.material.color.set(0xffff00)
 
                         if (this.trackedObjects[i].tag == 'building'){
-                            this["Hovered Element Information"] = this.trackedObjects[i].object.fileName;
+                            // Name of the file at the commit shown by the history playback
+                            var building = this.trackedObjects[i].object;
+                            this["Hovered Element Information"] = building.historicalName !== undefined ? building.historicalName : building.fileName;
                         }
                         else if (this.trackedObjects[i].tag == 'road'){
                             this["Hovered Element Information"] = 'Width :' + this.trackedObjects[i].object.routeWidth;
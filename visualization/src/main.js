@@ -1,16 +1,32 @@
 
-import { citiesData, routesData, commitToFiles, filesModificationsDates, url, commitsHashes, activeBranch } from '../data.js';
+import * as data from '../data.js';
 import { World } from './World/World.js'; 
 
 function main() {
 // Get a reference to the container element
 const container = document.querySelector('#scene-container');
 
+// hybrid couplings also export the cities laid out with the semantic couplings (?layout=semantic)
+const layout = new URLSearchParams(window.location.search).get('layout');
+const citiesData = (layout !== null && data[layout + 'CitiesData'] !== undefined) ? data[layout + 'CitiesData'] : data.citiesData;
+if (data.semanticCitiesData !== undefined) {
+  const layoutLink = document.createElement('a');
+  layoutLink.href = layout === 'semantic' ? '?layout=logical' : '?layout=semantic';
+  layoutLink.textContent = layout === 'semantic' ? 'Show logical layout' : 'Show semantic layout';
+  document.querySelector('#info').append(layoutLink);
+}
+
 // create a new world
-const world = new World(container, citiesData, routesData, commitToFiles, filesModificationsDates, url, commitsHashes, activeBranch);
+const world = new World(container, citiesData, data.routesData, data.commitToFiles, data.filesModificationsDates, data.url, data.commitsHashes, data.activeBranch, data.timeline);
 
 // start the animation loop
 world.start();
+
+// reload the visualization when the server pushes an update (--watch)
+if (window.EventSource) {
+  const events = new EventSource('/events');
+  events.addEventListener('update', () => window.location.reload());
+}
 }
 
 main();
\ No newline at end of file